@@ -1,12 +1,12 @@
 import os
 from celery import Celery
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from confg import AppConfig
+from .replicas import RoutingSQLAlchemy
 
-app_database = SQLAlchemy()
+app_database = RoutingSQLAlchemy()
 app_migrate = Migrate(db=app_database)
 
 app_login_manager = LoginManager()
@@ -14,16 +14,23 @@ app_login_manager.session_protection = 'strong'
 app_login_manager.login_view = 'auth.signin'
 
 app_celery = Celery(__name__, broker=os.environ.get('AMA_MSG_BROKER_URI'))
-app_celery.conf.update(accept_content=['json', 'pickle'])
+app_celery.conf.update(accept_content=['json', 'pickle'],
+                       task_routes={'app.tasks.*': {'queue': 'low_priority'}})
 
 def create_app(config):
     app = Flask(__name__)
     app.config.from_object(config)
     app.url_map.strict_slashes = False
 
+    from .replicas import init_app_replicas
+    init_app_replicas(app)
+
     app_database.init_app(app)
     app_migrate.init_app(app)
     app_login_manager.init_app(app)
+
+    from .cache import init_app_caches
+    init_app_caches(app)
     
     from .main import main as main_blueprint
     from .auth import auth as auth_blueprint
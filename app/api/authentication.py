@@ -10,7 +10,7 @@ api_multi_auth = MultiAuth(api_basic_auth, api_token_auth)
 
 @api_basic_auth.verify_password
 def api_verify_username_password(username, password):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='auth')
     if not user or not user.check_password(password):
         return False
     g.current_api_user = user
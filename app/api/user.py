@@ -1,50 +1,66 @@
 from flask import g, jsonify, current_app, request, abort
 from werkzeug.exceptions import NotFound
+from itsdangerous import BadSignature
 from app.models import User
 from .authentication import api_multi_auth
+from app import app_database
+from app.replicas import reads_from_replica, read_only
 from . import api
 from .errors import api_forbidden
 
 @api.route('/users/')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_users_list():
     users_per_page = request.args.get('n', current_app.config['API_USERS_PER_PAGE'], int)
     page_num = request.args.get('p', 1, int)
-    return User.api_get_users_list_json(page=page_num, users_per_page=users_per_page)
+    return User.api_get_users_list_json(page=page_num, users_per_page=users_per_page,
+                                        viewer=g.current_api_user)
 
 @api.route('/users/<username>/')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_user_profile_info(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='auth')
     if not user:
         abort(NotFound.code)
-    return jsonify(user.api_get_user_info())
+    return jsonify(user.api_get_user_info(follow_states=g.current_api_user.get_follow_states([user.id])))
 
 @api.route('/users/<username>/followers')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_followers_list(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     followers_per_page = request.args.get('n', current_app.config['API_FOLLOWERS_PER_PAGE'], int)
     page_num = request.args.get('p', 1, int)
-    return User.api_get_followers_list_json(user=user, page=page_num, followers_per_page=followers_per_page)
+    return User.api_get_followers_list_json(user=user, page=page_num, followers_per_page=followers_per_page,
+                                            viewer=g.current_api_user)
 
 @api.route('/users/<username>/following')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_followed_users_list(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     followed_users_per_page = request.args.get('n', current_app.config['API_FOLLOWED_USERS_PER_PAGE'], int)
     page_num = request.args.get('p', 1, int)
     return User.api_get_followed_users_list_json(user=user, page=page_num, 
-                                                 followed_users_per_page=followed_users_per_page)
+                                                 followed_users_per_page=followed_users_per_page,
+                                                 viewer=g.current_api_user)
 
 @api.route('/users/<username>/answered-questions')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_user_answered_questions(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     questions_per_page = request.args.get('n', current_app.config['API_ANSWERED_QUESTIONS_PER_PAGE'], int)
@@ -53,9 +69,11 @@ def api_get_user_answered_questions(username):
                                                 questions_per_page=questions_per_page)
 
 @api.route('/users/<username>/unanswered-questions')
+@reads_from_replica
+@read_only
 @api_multi_auth.login_required
 def api_get_user_unanswered_questions(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     if g.current_api_user.id != user.id:
@@ -63,4 +81,25 @@ def api_get_user_unanswered_questions(username):
     questions_per_page = request.args.get('n', current_app.config['API_UNANSWERED_QUESTIONS_PER_PAGE'], int)
     page_num = request.args.get('p', 1, int)
     return User.api_get_unanswered_questions_json(user=user, page=page_num, 
-                                                  questions_per_page=questions_per_page)
\ No newline at end of file
+                                                  questions_per_page=questions_per_page)
+
+@api.route('/feed')
+@reads_from_replica
+@read_only
+@api_multi_auth.login_required
+def api_get_home_feed():
+    questions_per_page = request.args.get('n', current_app.config['API_HOME_FEED_QUESTIONS_PER_PAGE'], int)
+    cursor = request.args.get('c')
+    try:
+        return User.api_get_home_feed_json(user=g.current_api_user, cursor=cursor,
+                                           questions_per_page=questions_per_page)
+    except BadSignature:
+        abort(NotFound.code)
+
+@api.route('/feed/new')
+@api_multi_auth.login_required
+def api_get_new_home_feed_questions():
+    questions_limit = request.args.get('n', current_app.config['API_HOME_FEED_QUESTIONS_PER_PAGE'], int)
+    response = User.api_get_new_home_feed_questions_json(user=g.current_api_user, questions_limit=questions_limit)
+    app_database.session.commit()
+    return response
\ No newline at end of file
@@ -11,11 +11,12 @@ from .forms import SignInForm, SignUpForm, PasswordChangeForm, EmailChangeForm,
                     PasswordResetForm, PasswordResetInitForm, PasswordResetRequestForm
 from . import auth
 from ..email import send_mail
+from ..tasks import prewarm_home_feed
 
 
 @app_login_manager.user_loader
 def load_user_object(user_id):
-    return User.query.get(int(user_id))
+    return User.load_user_snapshot(int(user_id))
 
 
 @auth.before_app_request
@@ -34,6 +35,12 @@ def signin():
         user = User.query.filter_by(username=signin_form.username.data).first()
         if user is not None and user.check_password(signin_form.password.data):
             login_user(user, remember=signin_form.remember_me.data)
+            if current_app.config['HOME_FEED_PREWARM_ON_SIGNIN']:
+                #best effort, signing in never depends on the message broker
+                try:
+                    prewarm_home_feed.delay(user.id)
+                except Exception:
+                    current_app.logger.exception('could not enqueue the home feed prewarm of user %s', user.id)
             flash('you have logged in successfully', category='info')
             if request.args.get('next'):
                 next_param = urlparse(request.args.get('next'))
@@ -82,6 +89,7 @@ def confirm_account(confirmation_token):
     if current_user.account_confirmed:
         return redirect(url_for('main.home'))
     if current_user.verify_confirmation_token(confirmation_token):
+        app_database.session.commit()
         flash('you have confirmed your account', category='info')
     else:
         flash('your confirmation link has expired', category='errors')
@@ -112,6 +120,7 @@ def change_password():
     if form.validate_on_submit():
         if current_user.check_password(form.current_password.data):
             current_user.password = form.new_password.data
+            app_database.session.commit()
             flash('your password have been updated successfully', category='info')
             return redirect(url_for('main.home'))
         flash('your current password does not match the one you have entered', category='error')
@@ -145,6 +154,7 @@ def confirm_new_email_address(confirmation_token):
               category='error')
         return redirect(url_for('main.home'))
     current_user.change_email(token_payload['new_email'])
+    app_database.session.commit()
     flash('your email address have been updated successfully', category='info')
     return redirect(url_for('main.home'))
 
@@ -199,6 +209,7 @@ def password_reset_confirm(confirmation_token):
         user = User.load_user_by_email_addr(user_email)
         if user:
             user.password = form.password.data
+            app_database.session.commit()
             flash('your password have been updated successfully', category='info')
         session.pop('password-reset-request')
         return redirect(url_for('auth.signin'))
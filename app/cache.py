@@ -0,0 +1,154 @@
+import threading, time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, _request_ctx_stack
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+'''
+in-process caches, one set per application instance (stored in app.extensions) so that
+applications created for different databases (unit tests) never share entries.
+the caches are per worker process: invalidate_on_commit only reaches the process that committed
+and single-flight only collapses the misses of one process, so every other worker keeps serving
+its entry until the ttl expires. the ttl of a cache is the staleness it accepts
+'''
+
+
+class TTLCache:
+    """
+    bounded cache whose entries expire (ttl) seconds after being stored, the least recently
+    used entry is evicted once (maxsize) entries are stored.
+    concurrent misses for the same key in the process are collapsed into a single build (single-flight)
+    """
+    _missing = object()
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._builds = {}
+        self._stale_builds = set()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return TTLCache._missing
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return TTLCache._missing
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key)
+        return default if value is TTLCache._missing else value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            #a value being built right now may have been computed from the outdated state
+            if key in self._builds:
+                self._stale_builds.add(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stale_builds.update(self._builds)
+
+    def get_or_build(self, key, build):
+        while True:
+            with self._lock:
+                value = self._get(key)
+                if value is not TTLCache._missing:
+                    return value
+                build_lock = self._builds.get(key)
+                is_builder = build_lock is None
+                if is_builder:
+                    build_lock = self._builds[key] = threading.Lock()
+                    build_lock.acquire()
+            if is_builder:
+                try:
+                    value = build()
+                    with self._lock:
+                        if key not in self._stale_builds:
+                            self._set(key, value)
+                    return value
+                finally:
+                    with self._lock:
+                        del self._builds[key]
+                        self._stale_builds.discard(key)
+                    build_lock.release()
+            #wait for the running build then read its value, or build again if it failed
+            with build_lock:
+                pass
+
+
+def init_app_caches(app):
+    app.extensions['ama_caches'] = {
+        'home_feed': TTLCache(maxsize=app.config['HOME_FEED_CACHE_SIZE'],
+                              ttl=app.config['HOME_FEED_CACHE_TTL']),
+        #keyed by the profile version, entries never need to be invalidated
+        'profile_page': TTLCache(maxsize=app.config['PROFILE_PAGE_CACHE_SIZE'],
+                                 ttl=app.config['PROFILE_PAGE_CACHE_TTL']),
+        'question_card': TTLCache(maxsize=app.config['QUESTION_CARD_CACHE_SIZE'],
+                                  ttl=app.config['QUESTION_CARD_CACHE_TTL']),
+        'auth_user': TTLCache(maxsize=app.config['AUTH_USER_CACHE_SIZE'],
+                              ttl=app.config['AUTH_USER_CACHE_TTL']),
+    }
+
+
+def get_app_cache(cache_name):
+    return current_app.extensions['ama_caches'][cache_name]
+
+
+def invalidate_on_commit(session, cache_name, *keys):
+    """drop the keys from the cache once the session's transaction is committed"""
+    session.info.setdefault('ama_cache_invalidations', set()).update((cache_name, key) for key in keys)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def apply_cache_invalidations(session):
+    for cache_name, key in session.info.pop('ama_cache_invalidations', ()):
+        session.app.extensions['ama_caches'][cache_name].invalidate(key)
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def discard_cache_invalidations(session):
+    session.info.pop('ama_cache_invalidations', None)
+
+
+def request_memoized(method):
+    """
+    memoize a model method for the lifetime of the current request, keyed by the instance's
+    id and the ids of the arguments. outside of requests the method is always called
+    """
+    @wraps(method)
+    def method_wrapper(self, *args):
+        request_ctx = _request_ctx_stack.top
+        if request_ctx is None or self.id is None:
+            return method(self, *args)
+        memo = request_ctx.__dict__.setdefault('ama_memo', {})
+        key = (method.__name__, self.id) + tuple(getattr(arg, 'id', arg) for arg in args)
+        if key not in memo:
+            memo[key] = method(self, *args)
+        return memo[key]
+    return method_wrapper
+
+
+def clear_request_memo():
+    request_ctx = _request_ctx_stack.top
+    if request_ctx is not None:
+        request_ctx.__dict__.pop('ama_memo', None)
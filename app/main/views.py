@@ -1,12 +1,14 @@
-import random
 from werkzeug.exceptions import NotFound
 from itsdangerous import TimedJSONWebSignatureSerializer, BadSignature
-from flask import render_template, abort, redirect, url_for, current_app, flash
+from flask import render_template, abort, redirect, url_for, current_app, flash, request, jsonify, \
+                  make_response, Markup, Response, stream_with_context, get_flashed_messages
 from flask_login import login_required, current_user
 from confg import TokenExpirationTime
 from app import app_database
-from app.models import User, AppPermissions, Role, Question
+from app.models import User, AppPermissions, Role, Question, TimelineEntry
+from app.cache import get_app_cache
 from ..decorators import permissions_required
+from ..replicas import reads_from_replica, read_only
 from .forms import UserProfileEditForm, UserAccountControlForm, AccountsControlForm, \
                    UserAskQuestion, UserAnswerQuestion
 from . import main
@@ -15,31 +17,179 @@ from . import main
 def templates_add_app_permissions():
     return dict(app_permissions=AppPermissions)
 
+@main.app_template_global()
+def render_answered_question_card(question, with_replier=True):
+    """
+    answered questions never change, their cards are rendered once and shared across requests
+    and users until the name or the email (avatar) of the asker or of the replier changes
+    """
+    card_key = (question.id, question.answer.id, with_replier,
+                question.asker.username, question.asker.email,
+                question.replier.username, question.replier.email)
+    return get_app_cache('question_card').get_or_build(
+        card_key, lambda: Markup(render_template('main/answered_question_card.html',
+                                                 question=question, with_replier=with_replier)))
+
+def stream_template(template_name, **context):
+    """
+    sends the page chunk by chunk while the template is being rendered, the request context
+    (and the database session) is kept until the last chunk is sent
+    """
+    if not current_app.config['STREAM_HTML_PAGES']:
+        return render_template(template_name, **context)
+    #the session cookie is saved before the first chunk is rendered, the flashed messages are popped
+    #from it now and kept by the request for the template
+    get_flashed_messages(with_categories=True)
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
+
+def home_feed_new_questions_uri(feed_marker):
+    if feed_marker is None:
+        return url_for('main.home_feed_new_questions')
+    return url_for('main.home_feed_new_questions', since=TimelineEntry.dump_marker(feed_marker))
+
 @main.route('/')
+@reads_from_replica
+@read_only
 @login_required
 def home():
-    questions_list = []
-    for user in current_user.get_followed_users_list():
-        for question in user.get_answered_questions(questions_limit=5):
-            questions_list.append(question)
-    random.shuffle(questions_list)
-    return render_template('main/home.html', questions_list=questions_list)
+    """
+    the page never writes, the seen marker is moved by the polls of home_feed_new_questions
+    which start from the newest question of the home timeline
+    """
+    questions_list, next_cursor = current_user.get_home_feed_page(lazy=True)
+    return stream_template('main/home.html', questions_list=questions_list,
+                           new_questions_uri=home_feed_new_questions_uri(current_user.get_feed_marker()),
+                           next_page_uri=url_for('main.home_feed_page', c=next_cursor) if next_cursor else None)
+
+@main.route('/feed')
+@reads_from_replica
+@read_only
+@login_required
+def home_feed_page():
+    """next page of the home feed as an html fragment, requested by the home page on scroll"""
+    try:
+        questions_list, next_cursor = current_user.get_home_feed_page(cursor=request.args.get('c'))
+    except BadSignature:
+        abort(NotFound.code)
+    return jsonify({
+        'html': render_template('main/home_feed_questions.html', questions_list=questions_list),
+        'next': url_for('main.home_feed_page', c=next_cursor) if next_cursor else None
+    })
+
+@main.route('/feed/new')
+@login_required
+def home_feed_new_questions():
+    """questions answered since the home feed was last seen, polled by the home page"""
+    try:
+        since = TimelineEntry.load_marker(request.args['since']) if 'since' in request.args else None
+    except BadSignature:
+        abort(NotFound.code)
+    questions_list, new_questions_count, newest_entry = current_user.get_new_timeline_questions(since=since)
+    #rendered before the commit, which expires the user and the questions read by the template
+    response = jsonify({
+        'html': render_template('main/home_feed_questions.html', questions_list=questions_list),
+        'count': new_questions_count,
+        'next': home_feed_new_questions_uri(newest_entry or since)
+    })
+    if newest_entry is not None:
+        current_user.mark_feed_seen(newest_entry)
+        app_database.session.commit()
+    return response
 
 @main.route('/u/<username>')
+@reads_from_replica
+@read_only
 @login_required
 def user_profile(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
+    if not user:
+        abort(NotFound.code)
+    #the page only changes with the profile version, which is cheap to compute from the loaded users
+    profile_version = user.get_profile_version(viewer=current_user)
+    if request.if_none_match.contains(profile_version):
+        response = make_response('', 304)
+    else:
+        response = make_response(get_app_cache('profile_page').get_or_build(
+            profile_version, lambda: render_template('main/user/user_profile.html', user=user)))
+    response.set_etag(profile_version)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def render_profile_tab_page(template, endpoint, user, page, items_list, has_next, **context):
+    """a page of one of the profile tabs as an html fragment, requested by the profile page"""
+    return jsonify({
+        'html': render_template(template, items_list=items_list, user=user, **context),
+        'next': url_for(endpoint, username=user.username, p=page + 1) if has_next else None
+    })
+
+@main.route('/u/<username>/answered-questions')
+@reads_from_replica
+@read_only
+@login_required
+def user_answered_questions_page(username):
+    user = User.load_user_by_username(username, profile='ref')
+    if not user:
+        abort(NotFound.code)
+    page = request.args.get('p', 1, int)
+    questions_list, has_next = user.get_answered_questions_page(
+        page=page, questions_per_page=current_app.config['PROFILE_QUESTIONS_PER_PAGE'])
+    return render_profile_tab_page('main/user/profile_answered_questions.html',
+                                   'main.user_answered_questions_page', user, page, questions_list, has_next)
+
+@main.route('/u/<username>/unanswered-questions')
+@reads_from_replica
+@read_only
+@login_required
+def user_unanswered_questions_page(username):
+    if current_user.username != username:
+        abort(NotFound.code)
+    page = request.args.get('p', 1, int)
+    questions_list, has_next = current_user.get_unanswered_questions_page(
+        page=page, questions_per_page=current_app.config['PROFILE_QUESTIONS_PER_PAGE'])
+    return render_profile_tab_page('main/user/profile_unanswered_questions.html',
+                                   'main.user_unanswered_questions_page', current_user, page,
+                                   questions_list, has_next)
+
+@main.route('/u/<username>/following')
+@reads_from_replica
+@read_only
+@login_required
+def user_followed_users_page(username):
+    user = User.load_user_by_username(username, profile='ref')
+    if not user:
+        abort(NotFound.code)
+    page = request.args.get('p', 1, int)
+    users_list, has_next = user.get_followed_users_page(
+        page=page, users_per_page=current_app.config['PROFILE_USERS_PER_PAGE'])
+    following_ids, followers_ids = current_user.get_follow_states(listed_user.id for listed_user in users_list)
+    return render_profile_tab_page('main/user/profile_users.html',
+                                   'main.user_followed_users_page', user, page, users_list, has_next,
+                                   following_ids=following_ids, followers_ids=followers_ids)
+
+@main.route('/u/<username>/followers')
+@reads_from_replica
+@read_only
+@login_required
+def user_followers_page(username):
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
-    return render_template('main/user/user_profile.html', 
-                           user=user, answered_questions=user.get_answered_questions(),
-                           unanswered_questions=user.get_unanswered_questions())
+    page = request.args.get('p', 1, int)
+    users_list, has_next = user.get_followers_page(
+        page=page, users_per_page=current_app.config['PROFILE_USERS_PER_PAGE'])
+    following_ids, followers_ids = current_user.get_follow_states(listed_user.id for listed_user in users_list)
+    return render_profile_tab_page('main/user/profile_users.html',
+                                   'main.user_followers_page', user, page, users_list, has_next,
+                                   following_ids=following_ids, followers_ids=followers_ids)
 
 @main.route('/u/<username>/ask-question', methods=['GET', 'POST'])
 @login_required
 @permissions_required(AppPermissions.ASK)
 def user_ask_question(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     if current_user.username == username:
@@ -48,6 +198,7 @@ def user_ask_question(username):
     if ask_question_form.validate_on_submit():
         current_user.ask_question(question_content=ask_question_form.question.data,
                                   question_recipient=user)
+        app_database.session.commit()
         flash('your question was sent successfully', category='info')
         return redirect(url_for('main.home'))
     return render_template('main/user/ask-question-form.html', form=ask_question_form, user=user)
@@ -55,7 +206,7 @@ def user_ask_question(username):
 @main.route('/u/<username>/answer/<int:question_id>', methods=['GET', 'POST'])
 @login_required
 def user_answer_question(username, question_id):
-    question = Question.load_question_by_id_or_404(question_id)
+    question = Question.load_question_by_id_or_404(question_id, profile='ref')
     if current_user.username != username \
                     or not current_user.is_question_replier(question) \
                     or question.has_answer:
@@ -64,6 +215,7 @@ def user_answer_question(username, question_id):
     if answer_question_form.validate_on_submit():
         current_user.answer_question(answer_content=answer_question_form.answer.data,
                                      question=question)
+        app_database.session.commit()
         return redirect(url_for('main.user_profile', username=current_user.username))
     return render_template('main/user/answer-question-form.html', form=answer_question_form)
 
@@ -77,6 +229,7 @@ def user_profile_edit(username):
         current_user.username = form.username.data
         current_user.about_me = form.about_me.data
         app_database.session.add(current_user._get_current_object())
+        app_database.session.commit()
         return redirect(url_for('main.user_profile', username=current_user.username))
     form.username.data = current_user.username
     form.about_me.data = current_user.about_me
@@ -105,7 +258,7 @@ def user_account_control(token, username):
         token_verify.loads(token)
     except BadSignature:
         abort(NotFound.code)
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     form = UserAccountControlForm(user)
@@ -114,6 +267,7 @@ def user_account_control(token, username):
         user.account_confirmed = form.account_confirmation.data
         user.role = Role.load_role_by_id(form.user_role.data)
         app_database.session.add(user)
+        app_database.session.commit()
         return redirect(url_for('main.user_profile', username=current_user.username))
     form.email.data = user.email
     form.account_confirmation.data = user.account_confirmed
@@ -124,22 +278,24 @@ def user_account_control(token, username):
 @login_required
 @permissions_required(AppPermissions.FOLLOW_OTHERS)
 def follow_user(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     if current_user.username == username or current_user.is_following(user):
         return redirect(url_for('main.home'))
     current_user.follow(user)
+    app_database.session.commit()
     return redirect(url_for('main.user_profile', username=user.username))
 
 @main.route('/u/<username>/unfollow')
 @login_required
 @permissions_required(AppPermissions.FOLLOW_OTHERS)
 def unfollow_user(username):
-    user = User.load_user_by_username(username)
+    user = User.load_user_by_username(username, profile='ref')
     if not user:
         abort(NotFound.code)
     if current_user.username == username or not current_user.is_following(user):
         return redirect(url_for('main.home'))
     current_user.unfollow(user)
+    app_database.session.commit()
     return redirect(url_for('main.user_profile', username=user.username))
@@ -1,11 +1,42 @@
-import hashlib, random, datetime
+import hashlib, random, datetime, json, zlib
+from itertools import chain
+from types import MappingProxyType
+from sqlalchemy import func, or_, and_, select, event, inspect, case, cast, literal, Integer, Float, DateTime
+from sqlalchemy.orm import aliased, joinedload, lazyload, raiseload, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from werkzeug.security import generate_password_hash, check_password_hash
 from faker import Faker
 from flask_login import UserMixin
+from flask_sqlalchemy import SignallingSession
 from flask import current_app, jsonify, url_for
-from itsdangerous import TimedJSONWebSignatureSerializer, BadSignature, SignatureExpired
+from itsdangerous import TimedJSONWebSignatureSerializer, URLSafeSerializer, BadSignature, SignatureExpired
 from confg import TokenExpirationTime
 from . import app_database
+from .cache import get_app_cache, invalidate_on_commit, request_memoized, clear_request_memo
+from .records import UserSummaryMixin, UserSummary, QuestionCard
+
+def paginate_without_count(query, page, items_per_page, load=None):
+    """
+    one page of the query and whether there is a next page, without the COUNT query of paginate,
+    core selects are passed with the (load) function building their records
+    """
+    page = max(page, 1)
+    query = query.offset((page - 1) * items_per_page).limit(items_per_page + 1)
+    items = load(query) if load is not None else query.all()
+    return items[:items_per_page], len(items) > items_per_page
+
+def with_loading_profile(query, model, profile):
+    """
+    applies the loader options of the (profile) of (model) (see the get_loading_options of the models)
+    picked by the view. relationships left out of the profile are lazy loaded, or raise on access
+    when RAISE_ON_LAZY_LOAD is set so that the tests catch the lazy loads a view did not plan for
+    """
+    if profile is None:
+        return query
+    options = model.get_loading_options(profile)
+    if current_app.config['RAISE_ON_LAZY_LOAD']:
+        options.append(raiseload('*'))
+    return query.options(*options)
 
 class AppPermissions:
     ASK = 0x1
@@ -18,7 +49,7 @@ class Role(app_database.Model):
     id = app_database.Column(app_database.Integer, primary_key=True)
     role_name = app_database.Column(app_database.String(32), unique=True)
     permissions = app_database.Column(app_database.Integer)
-    users = app_database.relationship('User', backref=app_database.backref('role', lazy='joined'),
+    users = app_database.relationship('User', backref=app_database.backref('role', lazy='select'),
                                       lazy='dynamic')
 
     @staticmethod
@@ -48,9 +79,61 @@ class Role(app_database.Model):
             app_database.session.add(role_)
             app_database.session.commit()
 
+    @staticmethod
+    def load_roles_map():
+        """
+        immutable in-process map of role id to (role name, permissions) read by the permission checks.
+        it is loaded on first use and dropped whenever roles are written (populate_table, role edits),
+        other worker processes pick role changes up once restarted
+        """
+        roles_map = current_app.extensions.get('ama_roles')
+        if roles_map is None:
+            roles_map = MappingProxyType({role_id: (role_name, permissions or 0) for role_id, role_name, permissions
+                                          in app_database.session.query(Role.id, Role.role_name, Role.permissions)})
+            current_app.extensions['ama_roles'] = roles_map
+        return roles_map
+
+    @staticmethod
+    def get_permissions(role_id):
+        role_name, permissions = Role.load_roles_map().get(role_id, (None, 0))
+        return permissions
+
+    @staticmethod
+    def get_role_name(role_id):
+        role_name, permissions = Role.load_roles_map().get(role_id, (None, 0))
+        return role_name
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def forget_roles_map(session, flush_context):
+    #new, dirty and deleted still hold the pre flush state of the session
+    if any(isinstance(instance, Role) for instance in chain(session.new, session.dirty, session.deleted)):
+        session.app.extensions.pop('ama_roles', None)
+        session.info['ama_roles_written'] = True
+
+
+@event.listens_for(Role.role_name, 'set')
+@event.listens_for(Role.permissions, 'set')
+def forget_edited_roles_map(role, value, old_value, initiator):
+    #reloading the map flushes the pending edit of the role
+    current_app.extensions.pop('ama_roles', None)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+@event.listens_for(SignallingSession, 'after_rollback')
+def forget_written_roles_map(session):
+    #the map may have been reloaded between the flush and the end of the transaction
+    if session.info.pop('ama_roles_written', False):
+        session.app.extensions.pop('ama_roles', None)
+
 
 class Question(app_database.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        #has_answer comes last so that the index also keeps a replier's questions in timestamp order
+        #when they are not filtered on has_answer
+        app_database.Index('ix_questions_replier_id_timestamp_has_answer', 'replier_id', 'timestamp', 'has_answer'),
+    )
 
     id = app_database.Column(app_database.Integer, primary_key=True)
     question_content = app_database.Column(app_database.String(500))
@@ -60,33 +143,458 @@ class Question(app_database.Model):
     has_answer = app_database.Column(app_database.Boolean, default=False)
     answer = app_database.relationship('Answer',
                                        uselist=False,
-                                       backref=app_database.backref('question', lazy='joined'),
-                                       lazy='joined')
+                                       backref=app_database.backref('question', lazy='select'),
+                                       lazy='select')
 
     @staticmethod
-    def load_question_by_id(question_id):
-        return Question.query.get(question_id)
+    def get_loading_options(profile):
+        """
+        ref: the question alone, answer: with its answer (get_answered_at). the cards of the pages
+        and of the api lists are read-only records (see Question.select_cards), not loaded questions
+        """
+        return {
+            'ref': [],
+            'answer': [joinedload(Question.answer)],
+        }[profile]
+
+    @staticmethod
+    def load_question_by_id(question_id, profile=None):
+        return with_loading_profile(Question.query, Question, profile).get(question_id)
     
     @staticmethod
-    def load_question_by_id_or_404(question_id):
-        return Question.query.get_or_404(question_id)
+    def load_question_by_id_or_404(question_id, profile=None):
+        return with_loading_profile(Question.query, Question, profile).get_or_404(question_id)
+
+    def get_answered_at(self):
+        #answers written before answers were timestamped are dated by their question
+        if self.answer is not None and self.answer.timestamp is not None:
+            return self.answer.timestamp
+        return self.timestamp
+
+    @staticmethod
+    def window_functions_supported():
+        dialect = app_database.engine.dialect
+        if dialect.name != 'sqlite':
+            return True
+        #window functions were added in sqlite 3.25
+        return dialect.dbapi.sqlite_version_info >= (3, 25)
+
+    @staticmethod
+    def load_followed_users_answered_questions(user, questions_per_user):
+        """
+        the most recent (questions_per_user) answered questions of every user followed by (user),
+        loaded with a single statement whatever the number of followed users
+        """
+        if Question.window_functions_supported():
+            ranked_questions = (app_database.session
+                                    .query(Question.id.label('question_id'),
+                                           func.row_number().over(
+                                               partition_by=Question.replier_id,
+                                               order_by=(Question.timestamp.desc(), Question.id.desc())
+                                           ).label('rank'))
+                                    .join(Follow, Follow.followed_id == Question.replier_id)
+                                    .filter(Follow.follower_id == user.id, Question.has_answer.is_(True))
+                                    .subquery())
+            questions = (with_loading_profile(Question.query, Question, 'answer')
+                                 .join(ranked_questions, ranked_questions.c.question_id == Question.id)
+                                 .filter(ranked_questions.c.rank <= questions_per_user))
+        else:
+            newer_question = aliased(Question)
+            newer_questions_count = (app_database.session
+                                         .query(func.count(newer_question.id))
+                                         .filter(newer_question.replier_id == Question.replier_id,
+                                                 newer_question.has_answer.is_(True),
+                                                 or_(newer_question.timestamp > Question.timestamp,
+                                                     and_(newer_question.timestamp == Question.timestamp,
+                                                          newer_question.id > Question.id)))
+                                         .correlate(Question)
+                                         .as_scalar())
+            questions = (with_loading_profile(Question.query, Question, 'answer')
+                                 .join(Follow, Follow.followed_id == Question.replier_id)
+                                 .filter(Follow.follower_id == user.id,
+                                         Question.has_answer.is_(True),
+                                         newer_questions_count < questions_per_user))
+        return questions.order_by(Question.timestamp.desc(), Question.id.desc()).all()
+
+    @staticmethod
+    def select_cards():
+        """core select of the columns shown by question cards, filter and order it then pass it to load_cards"""
+        questions, answers = Question.__table__, Answer.__table__
+        askers, repliers = User.__table__.alias('askers'), User.__table__.alias('repliers')
+        return (select([questions.c.id, questions.c.question_content, questions.c.timestamp,
+                        questions.c.has_answer, questions.c.asker_id, questions.c.replier_id,
+                        askers.c.username.label('asker_username'), askers.c.email.label('asker_email'),
+                        askers.c.avatar_hash.label('asker_avatar_hash'),
+                        repliers.c.username.label('replier_username'), repliers.c.email.label('replier_email'),
+                        repliers.c.avatar_hash.label('replier_avatar_hash'),
+                        answers.c.id.label('answer_id'), answers.c.answer_content,
+                        answers.c.timestamp.label('answer_timestamp')])
+                    .select_from(questions.outerjoin(askers, askers.c.id == questions.c.asker_id)
+                                          .outerjoin(repliers, repliers.c.id == questions.c.replier_id)
+                                          .outerjoin(answers, answers.c.question_id == questions.c.id)))
+
+    @staticmethod
+    def load_cards(statement):
+        return [QuestionCard(row) for row in app_database.session.execute(statement)]
+
+    @staticmethod
+    def iter_cards(statement):
+        """load_cards fetching the rows while the cards are consumed, for the pages streamed as they are rendered"""
+        for row in app_database.session.execute(statement.execution_options(stream_results=True)):
+            yield QuestionCard(row)
+
+    @staticmethod
+    def archive_answered_questions(asked_before, questions_limit):
+        """
+        moves up to (questions_limit) answered questions asked before (asked_before) and their answers
+        to the archive, their timeline entries are dropped. returns the number of archived questions
+        """
+        questions, answers = Question.__table__, Answer.__table__
+        rows = app_database.session.execute(
+            select([questions.c.id, questions.c.asker_id, questions.c.replier_id, questions.c.timestamp,
+                    questions.c.question_content, answers.c.id.label('answer_id'), answers.c.answer_content,
+                    answers.c.timestamp.label('answer_timestamp')])
+                .select_from(questions.join(answers, answers.c.question_id == questions.c.id))
+                .where(and_(questions.c.has_answer.is_(True), questions.c.timestamp < asked_before))
+                .order_by(questions.c.id)
+                .limit(questions_limit)).fetchall()
+        if not rows:
+            return 0
+        questions_ids = [row['id'] for row in rows]
+        app_database.session.execute(ArchivedQuestion.__table__.insert(), [{
+            'id': row['id'],
+            'answer_id': row['answer_id'],
+            'asker_id': row['asker_id'],
+            'replier_id': row['replier_id'],
+            'timestamp': row['timestamp'],
+            'answer_timestamp': row['answer_timestamp'],
+            'archived_at': datetime.datetime.utcnow(),
+            'content': ArchivedQuestion.pack_content(row['question_content'], row['answer_content'])
+        } for row in rows])
+        app_database.session.execute(TimelineEntry.__table__.delete()
+                                                            .where(TimelineEntry.question_id.in_(questions_ids)))
+        app_database.session.execute(answers.delete().where(answers.c.question_id.in_(questions_ids)))
+        app_database.session.execute(questions.delete().where(questions.c.id.in_(questions_ids)))
+        return len(rows)
+
+    @staticmethod
+    def load_cards_by_ids(questions_ids, lazy=False):
+        """the cards of the questions in the order of (questions_ids), an iterator of iter_cards when (lazy)"""
+        if not questions_ids:
+            return []
+        if lazy:
+            positions = {question_id: position for position, question_id in enumerate(questions_ids)}
+            return Question.iter_cards(Question.select_cards()
+                                               .where(Question.id.in_(questions_ids))
+                                               .order_by(case(positions, value=Question.id)))
+        cards = {card.id: card
+                 for card in Question.load_cards(Question.select_cards().where(Question.id.in_(questions_ids)))}
+        return [cards[question_id] for question_id in questions_ids if question_id in cards]
 
 class Answer(app_database.Model):
     __tablename__ = 'answers'
+    __table_args__ = (
+        app_database.Index('ix_answers_question_id', 'question_id'),
+    )
 
     id = app_database.Column(app_database.Integer, primary_key=True)
     answer_content = app_database.Column(app_database.String(500))
+    timestamp = app_database.Column(app_database.DateTime, default=datetime.datetime.utcnow)
     question_id = app_database.Column(app_database.Integer, app_database.ForeignKey('questions.id'))
 
+class ArchivedQuestion(app_database.Model):
+    """
+    answered questions moved out of the hot questions and answers tables once old enough
+    (see Question.archive_answered_questions). their contents are compressed only when long enough
+    (QUESTIONS_ARCHIVE_COMPRESS_MIN_BYTES) for zlib to pay off, its header and the statistics
+    it has to learn from scratch make the short contents of most questions larger
+    """
+    __tablename__ = 'archived_questions'
+    __table_args__ = (
+        app_database.Index('ix_archived_questions_replier_id_timestamp', 'replier_id', 'timestamp'),
+    )
+
+    #ids of the archived question and of its answer
+    id = app_database.Column(app_database.Integer, primary_key=True, autoincrement=False)
+    answer_id = app_database.Column(app_database.Integer)
+    asker_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
+    replier_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
+    timestamp = app_database.Column(app_database.DateTime)
+    answer_timestamp = app_database.Column(app_database.DateTime)
+    archived_at = app_database.Column(app_database.DateTime, default=datetime.datetime.utcnow)
+    content = app_database.Column(app_database.LargeBinary)
+
+    #the first byte of the stored contents, zlib streams written before start with 0x78
+    content_plain_format = b'j'
+    content_compressed_format = b'z'
+
+    @staticmethod
+    def pack_content(question_content, answer_content):
+        content = json.dumps([question_content, answer_content], separators=(',', ':')).encode('utf-8')
+        if len(content) >= current_app.config['QUESTIONS_ARCHIVE_COMPRESS_MIN_BYTES']:
+            compressed_content = zlib.compress(content, 9)
+            if len(compressed_content) < len(content):
+                return ArchivedQuestion.content_compressed_format + compressed_content
+        return ArchivedQuestion.content_plain_format + content
+
+    @staticmethod
+    def unpack_content(content):
+        content_format, packed_content = content[:1], content[1:]
+        if content_format == ArchivedQuestion.content_plain_format:
+            question_content, answer_content = json.loads(packed_content.decode('utf-8'))
+        elif content_format == ArchivedQuestion.content_compressed_format:
+            question_content, answer_content = json.loads(zlib.decompress(packed_content).decode('utf-8'))
+        else:
+            return json.loads(zlib.decompress(content).decode('utf-8'))
+        return {'question_content': question_content, 'answer_content': answer_content}
+
+    @staticmethod
+    def select_cards():
+        """core select of the columns of the cards of archived questions, see Question.select_cards"""
+        archived = ArchivedQuestion.__table__
+        askers, repliers = User.__table__.alias('askers'), User.__table__.alias('repliers')
+        return (select([archived.c.id, archived.c.timestamp, archived.c.asker_id, archived.c.replier_id,
+                        askers.c.username.label('asker_username'), askers.c.email.label('asker_email'),
+                        askers.c.avatar_hash.label('asker_avatar_hash'),
+                        repliers.c.username.label('replier_username'), repliers.c.email.label('replier_email'),
+                        repliers.c.avatar_hash.label('replier_avatar_hash'),
+                        archived.c.answer_id, archived.c.answer_timestamp, archived.c.content])
+                    .select_from(archived.outerjoin(askers, askers.c.id == archived.c.asker_id)
+                                         .outerjoin(repliers, repliers.c.id == archived.c.replier_id)))
+
+    @staticmethod
+    def load_cards(statement):
+        cards = []
+        for row in app_database.session.execute(statement):
+            card_row = dict(row, has_answer=True, **ArchivedQuestion.unpack_content(row['content']))
+            cards.append(QuestionCard(card_row))
+        return cards
+
 class Follow(app_database.Model):
     __tablename__ = 'follows'
+    __table_args__ = (
+        app_database.Index('ix_follows_follower_id_followed_id', 'follower_id', 'followed_id'),
+        app_database.Index('ix_follows_followed_id_follower_id', 'followed_id', 'follower_id'),
+        #followers and following pages, newest follows first
+        app_database.Index('ix_follows_followed_id_timestamp', 'followed_id', 'timestamp'),
+        app_database.Index('ix_follows_follower_id_timestamp', 'follower_id', 'timestamp'),
+    )
 
     id = app_database.Column(app_database.Integer, primary_key=True)
     timestamp = app_database.Column(app_database.DateTime, default=datetime.datetime.utcnow)    
     follower_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
     followed_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
 
-class User(UserMixin, app_database.Model):
+class TimelineEntry(app_database.Model):
+    """materialized home timeline, one row per (timeline owner, answered question)"""
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (
+        #the keysets of the new questions (timestamp, question id) and of the ranked pages (score, question id)
+        app_database.Index('ix_timeline_entries_owner_id_timestamp_question_id',
+                           'owner_id', 'timestamp', 'question_id'),
+        app_database.Index('ix_timeline_entries_owner_id_score_question_id',
+                           'owner_id', 'score', 'question_id'),
+    )
+
+    id = app_database.Column(app_database.Integer, primary_key=True)
+    owner_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
+    author_id = app_database.Column(app_database.Integer, app_database.ForeignKey('users.id'))
+    question_id = app_database.Column(app_database.Integer, app_database.ForeignKey('questions.id'))
+    timestamp = app_database.Column(app_database.DateTime, default=datetime.datetime.utcnow)
+    score = app_database.Column(app_database.Float, default=0)
+    question = app_database.relationship('Question', lazy='select')
+
+    score_epoch = datetime.datetime(1970, 1, 1)
+
+    @staticmethod
+    def dump_cursor(score, question_id):
+        serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='timeline-cursor')
+        return serializer.dumps([score, question_id])
+
+    @staticmethod
+    def load_cursor(cursor):
+        """raises BadSignature for cursors that were not generated by dump_cursor"""
+        serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='timeline-cursor')
+        score, question_id = serializer.loads(cursor)
+        return score, question_id
+
+    marker_timestamp_format = '%Y-%m-%d %H:%M:%S.%f'
+
+    @staticmethod
+    def dump_marker(marker):
+        """a (timestamp, question id) marker of the new questions feed as an opaque string"""
+        serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='feed-marker')
+        timestamp, question_id = marker
+        return serializer.dumps([timestamp.strftime(TimelineEntry.marker_timestamp_format), question_id])
+
+    @staticmethod
+    def load_marker(marker):
+        """raises BadSignature for markers that were not generated by dump_marker"""
+        serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='feed-marker')
+        timestamp, question_id = serializer.loads(marker)
+        return datetime.datetime.strptime(timestamp, TimelineEntry.marker_timestamp_format), question_id
+
+    @staticmethod
+    def rank(answered_at, ranking_bonus):
+        """the ranking score is the answer's age in seconds shifted forward by the ranking bonus"""
+        return (answered_at - TimelineEntry.score_epoch).total_seconds() + ranking_bonus
+
+    @staticmethod
+    def days_between(earlier, later):
+        """sql expression of the number of whole days elapsed from (earlier) to (later)"""
+        if app_database.engine.dialect.name == 'sqlite':
+            return cast(func.julianday(later) - func.julianday(earlier), Integer)
+        return cast(func.floor(func.extract('epoch', later - earlier) / 86400), Integer)
+
+    @staticmethod
+    def select_ranking_bonuses(owner_id=None, author_id=None):
+        """
+        core select of the ranking bonus of the follow pairs of the given timeline owner or author,
+        (follower_id, followed_id, ranking_bonus), in seconds:
+            - the age of the follow at ranking time, in days, capped
+            - the number of questions the owner asked the author, capped
+        """
+        config = current_app.config
+        questions, follows = Question.__table__, Follow.__table__
+        asked_questions = select([questions.c.asker_id, questions.c.replier_id,
+                                  func.count(questions.c.id).label('questions_count')])
+        follows_criteria = []
+        if owner_id is not None:
+            asked_questions = asked_questions.where(questions.c.asker_id == owner_id)
+            follows_criteria.append(follows.c.follower_id == owner_id)
+        if author_id is not None:
+            asked_questions = asked_questions.where(questions.c.replier_id == author_id)
+            follows_criteria.append(follows.c.followed_id == author_id)
+        asked_questions = asked_questions.group_by(questions.c.asker_id, questions.c.replier_id).alias()
+        follow_age = func.coalesce(TimelineEntry.days_between(follows.c.timestamp,
+                                                              literal(datetime.datetime.utcnow(), DateTime)), 0)
+        questions_count = func.coalesce(asked_questions.c.questions_count, 0)
+        max_follow_age = config['HOME_FEED_RANK_MAX_FOLLOW_AGE_DAYS']
+        max_affinity = config['HOME_FEED_RANK_MAX_AFFINITY']
+        ranking_bonus = (case([(follow_age < 0, 0), (follow_age > max_follow_age, max_follow_age)], else_=follow_age) *
+                         config['HOME_FEED_RANK_FOLLOW_AGE_WEIGHT'] +
+                         case([(questions_count > max_affinity, max_affinity)], else_=questions_count) *
+                         config['HOME_FEED_RANK_AFFINITY_WEIGHT'])
+        return (select([follows.c.follower_id, follows.c.followed_id, ranking_bonus.label('ranking_bonus')])
+                    .select_from(follows.outerjoin(asked_questions,
+                                                   and_(asked_questions.c.asker_id == follows.c.follower_id,
+                                                        asked_questions.c.replier_id == follows.c.followed_id)))
+                    .where(and_(*follows_criteria)))
+
+    @staticmethod
+    def load_ranking_bonuses(owner_id=None, author_id=None):
+        """the ranking bonuses of select_ranking_bonuses keyed by (owner id, author id)"""
+        return {(follower_id, followed_id): ranking_bonus
+                for follower_id, followed_id, ranking_bonus in
+                app_database.session.execute(TimelineEntry.select_ranking_bonuses(owner_id=owner_id,
+                                                                                  author_id=author_id))}
+
+    @staticmethod
+    def create_entry(owner_id, author_id, question, answered_at, ranking_bonuses):
+        return TimelineEntry(owner_id=owner_id, author_id=author_id, question=question,
+                             timestamp=answered_at,
+                             score=TimelineEntry.rank(answered_at,
+                                                      ranking_bonuses.get((owner_id, author_id), 0)))
+
+    @staticmethod
+    def fan_out(question, author, answered_at):
+        """
+        push a newly answered question to the timelines of the author's followers,
+        answers of high follower accounts are not pushed but merged into the feed at read time
+        """
+        if author.is_high_follower_account():
+            return
+        if question.id is None:
+            app_database.session.flush()
+        #a single INSERT ... SELECT over the author's follows, the entries are ranked by the database
+        ranking_bonuses = TimelineEntry.select_ranking_bonuses(author_id=author.id).alias('ranking_bonuses')
+        app_database.session.execute(TimelineEntry.__table__.insert().from_select(
+            ['owner_id', 'author_id', 'question_id', 'timestamp', 'score'],
+            select([ranking_bonuses.c.follower_id, literal(author.id, Integer), literal(question.id, Integer),
+                    literal(answered_at, DateTime),
+                    literal(TimelineEntry.rank(answered_at, 0), Float) + ranking_bonuses.c.ranking_bonus])))
+        invalidate_on_commit(app_database.session, 'home_feed',
+                             *[follower_id for follower_id, in (app_database.session
+                                                                    .query(Follow.follower_id)
+                                                                    .filter(Follow.followed_id == author.id))])
+
+    @staticmethod
+    def push_author_questions(owner, author, questions_limit):
+        """seed the owner's timeline with the author's most recent answered questions"""
+        if author.is_high_follower_account():
+            return
+        ranking_bonuses = TimelineEntry.load_ranking_bonuses(owner_id=owner.id, author_id=author.id)
+        for question in author.get_answered_questions(questions_limit=questions_limit, profile='answer'):
+            app_database.session.add(TimelineEntry.create_entry(owner_id=owner.id, author_id=author.id,
+                                                                question=question,
+                                                                answered_at=question.get_answered_at(),
+                                                                ranking_bonuses=ranking_bonuses))
+
+    @staticmethod
+    def remove_author_questions(owner, author):
+        (TimelineEntry.query
+                      .filter(TimelineEntry.owner_id == owner.id, TimelineEntry.author_id == author.id)
+                      .delete(synchronize_session=False))
+
+    @staticmethod
+    def trim_timelines(after_owner_id=0, owners_limit=None):
+        """
+        drops the entries ranked below the HOME_FEED_TIMELINE_MAX_ENTRIES first ones from the timelines
+        of the (owners_limit) users that come after (after_owner_id) in id order, returns the id
+        of the last user of the batch (None once there are no users left)
+        """
+        max_entries = current_app.config['HOME_FEED_TIMELINE_MAX_ENTRIES']
+        owners_ids = [user_id for user_id, in (app_database.session.query(User.id)
+                                                                    .filter(User.id > after_owner_id)
+                                                                    .order_by(User.id)
+                                                                    .limit(owners_limit))]
+        if not owners_ids:
+            return None
+        for owner_id, in (app_database.session.query(TimelineEntry.owner_id)
+                                              .filter(TimelineEntry.owner_id.in_(owners_ids))
+                                              .group_by(TimelineEntry.owner_id)
+                                              .having(func.count(TimelineEntry.id) > max_entries)):
+            score, question_id = (app_database.session.query(TimelineEntry.score, TimelineEntry.question_id)
+                                                      .filter(TimelineEntry.owner_id == owner_id)
+                                                      .order_by(TimelineEntry.score.desc(),
+                                                                TimelineEntry.question_id.desc())
+                                                      .offset(max_entries - 1)
+                                                      .limit(1).one())
+            (TimelineEntry.query
+                          .filter(TimelineEntry.owner_id == owner_id,
+                                  or_(TimelineEntry.score < score,
+                                      and_(TimelineEntry.score == score, TimelineEntry.question_id < question_id)))
+                          .delete(synchronize_session=False))
+        return owners_ids[-1]
+
+    @staticmethod
+    def rank_pulled_questions(owner, authors_ids, after, entries_limit):
+        """
+        rank the answered questions of authors whose answers are not pushed to their followers,
+        returns up to (entries_limit) (score, question id) pairs per author ranked below (after)
+        """
+        ranking_bonuses = TimelineEntry.load_ranking_bonuses(owner_id=owner.id)
+        answered_at = func.coalesce(Answer.timestamp, Question.timestamp)
+        entries = []
+        for author_id in authors_ids:
+            ranking_bonus = ranking_bonuses.get((owner.id, author_id), 0)
+            questions = (app_database.session.query(Question.id, answered_at)
+                                             .join(Answer, Answer.question_id == Question.id)
+                                             .filter(Question.replier_id == author_id,
+                                                     Question.has_answer.is_(True)))
+            if after is not None:
+                #the extra millisecond absorbs the float rounding of the score, the exact bound is checked below
+                answered_before = TimelineEntry.score_epoch + \
+                        datetime.timedelta(seconds=after[0] - ranking_bonus, milliseconds=1)
+                questions = questions.filter(answered_at <= answered_before)
+            for question_id, question_answered_at in (questions.order_by(answered_at.desc(), Question.id.desc())
+                                                               .limit(entries_limit)):
+                entry = (TimelineEntry.rank(question_answered_at, ranking_bonus), question_id)
+                if after is None or entry < tuple(after):
+                    entries.append(entry)
+        return entries
+
+class User(UserSummaryMixin, UserMixin, app_database.Model):
     __tablename__ = "users"
     
     id = app_database.Column(app_database.Integer, primary_key=True)
@@ -98,24 +606,37 @@ class User(UserMixin, app_database.Model):
     about_me = app_database.Column(app_database.String(300))
     avatar_hash = app_database.Column(app_database.String(32))
     api_auth_token = app_database.Column(app_database.String(300))
+    #arrival timestamp and question id of the newest home feed question delivered to the user
+    last_feed_seen_at = app_database.Column(app_database.DateTime)
+    last_feed_seen_question_id = app_database.Column(app_database.Integer)
+    #denormalized counters, kept up to date by follow/unfollow/ask_question/answer_question
+    #and fixed by the periodic reconciliation task (app.tasks.reconcile_user_counters)
+    followers_count = app_database.Column(app_database.Integer, default=0, server_default='0', nullable=False)
+    followed_users_count = app_database.Column(app_database.Integer, default=0, server_default='0', nullable=False)
+    answered_questions_count = app_database.Column(app_database.Integer, default=0, server_default='0', nullable=False)
+    unanswered_questions_count = app_database.Column(app_database.Integer, default=0, server_default='0', nullable=False)
     in_questions = app_database.relationship('Question',
                                              foreign_keys=[Question.replier_id],
-                                             backref=app_database.backref('replier', lazy='joined'),
+                                             backref=app_database.backref('replier', lazy='select'),
                                              lazy='dynamic')
     out_questions = app_database.relationship('Question',
                                               foreign_keys=[Question.asker_id],
-                                              backref=app_database.backref('asker', lazy='joined'),
+                                              backref=app_database.backref('asker', lazy='select'),
                                               lazy='dynamic')
     follows = app_database.relationship('Follow',
                                         foreign_keys=[Follow.follower_id],
-                                        backref=app_database.backref('follower', lazy='joined'),
+                                        backref=app_database.backref('follower', lazy='select'),
                                         lazy='dynamic',
                                         cascade='all, delete-orphan')
     followed_by = app_database.relationship('Follow',
                                             foreign_keys=[Follow.followed_id],
-                                            backref=app_database.backref('followed', lazy='joined'),
+                                            backref=app_database.backref('followed', lazy='select'),
                                             lazy='dynamic',
                                             cascade='all, delete-orphan')
+    timeline = app_database.relationship('TimelineEntry',
+                                         foreign_keys=[TimelineEntry.owner_id],
+                                         lazy='dynamic',
+                                         cascade='all, delete-orphan')
     
     fake_user_questions_count = 20
     fake_user_answers_count = fake_user_questions_count - 2
@@ -183,16 +704,123 @@ class User(UserMixin, app_database.Model):
         app_database.session.commit()
 
     @staticmethod
-    def load_user_by_username(username):
-        return User.query.filter(User.username == username).first()
+    def backfill_timelines(after_user_id=0, users_limit=None):
+        """
+        rebuilds the home timelines of the (users_limit) users that come after (after_user_id) in id order
+        from the follows and questions tables, returns the id of the last user of the batch
+        (None once there are no users left)
+        """
+        users = User.query.filter(User.id > after_user_id).order_by(User.id).limit(users_limit).all()
+        for user in users:
+            user.rebuild_timeline()
+        return users[-1].id if users else None
+
+    @staticmethod
+    def reconcile_counters(after_user_id=0, users_limit=None):
+        """
+        recounts the denormalized counters of the (users_limit) users that come after (after_user_id)
+        in id order and fixes the drifted ones, returns the id of the last user of the batch
+        (None once there are no users left)
+        """
+        users_ids = [user_id for user_id, in (app_database.session.query(User.id)
+                                                                   .filter(User.id > after_user_id)
+                                                                   .order_by(User.id)
+                                                                   .limit(users_limit))]
+        if not users_ids:
+            return None
+        def count_by(column, *criteria):
+            return dict(app_database.session.query(column, func.count())
+                                            .filter(column.in_(users_ids), *criteria)
+                                            .group_by(column))
+        counters = {
+            'followers_count': count_by(Follow.followed_id),
+            'followed_users_count': count_by(Follow.follower_id),
+            'answered_questions_count': count_by(Question.replier_id, Question.has_answer.is_(True)),
+            'unanswered_questions_count': count_by(Question.replier_id, Question.has_answer.is_(False)),
+        }
+        #archived questions are answered questions too
+        answered_questions_counts = counters['answered_questions_count']
+        for user_id, count in count_by(ArchivedQuestion.replier_id).items():
+            answered_questions_counts[user_id] = answered_questions_counts.get(user_id, 0) + count
+        drifted_users = []
+        for user in (app_database.session.query(User.id, User.followers_count, User.followed_users_count,
+                                                User.answered_questions_count, User.unanswered_questions_count)
+                                         .filter(User.id.in_(users_ids))):
+            user_counters = {counter: counts.get(user.id, 0) for counter, counts in counters.items()}
+            if any(getattr(user, counter) != count for counter, count in user_counters.items()):
+                user_counters['id'] = user.id
+                drifted_users.append(user_counters)
+        app_database.session.bulk_update_mappings(User, drifted_users)
+        return users_ids[-1]
+
+    def rebuild_timeline(self):
+        invalidate_on_commit(app_database.session, 'home_feed', self.id)
+        self.timeline.delete(synchronize_session=False)
+        questions = Question.load_followed_users_answered_questions(
+            user=self,
+            questions_per_user=current_app.config['HOME_FEED_QUESTIONS_PER_FOLLOWED_USER'])
+        pulled_users_ids = self.get_high_follower_followed_users_ids()
+        ranking_bonuses = TimelineEntry.load_ranking_bonuses(owner_id=self.id)
+        app_database.session.add_all([TimelineEntry.create_entry(owner_id=self.id,
+                                                                 author_id=question.replier_id,
+                                                                 question=question,
+                                                                 answered_at=question.get_answered_at(),
+                                                                 ranking_bonuses=ranking_bonuses)
+                                      for question in questions
+                                      if question.replier_id not in pulled_users_ids])
+
+    @staticmethod
+    def get_loading_options(profile):
+        """
+        ref: the user alone, auth: the signed in user, its permissions and role name are read
+        from the roles map (see Role.load_roles_map), the role itself is only lazy loaded by
+        the code editing roles
+        """
+        return {
+            'ref': [],
+            'auth': [lazyload(User.role)],
+        }[profile]
+
+    @staticmethod
+    def load_user_by_username(username, profile=None):
+        return with_loading_profile(User.query, User, profile).filter(User.username == username).first()
 
     @staticmethod
-    def load_user_by_email_addr(email_addr):
-        return User.query.filter(User.email == email_addr).first()
+    def load_user_by_email_addr(email_addr, profile=None):
+        return with_loading_profile(User.query, User, profile).filter(User.email == email_addr).first()
 
     @staticmethod
-    def load_user_by_id(user_id):
-        return User.query.filter(User.id == user_id).first()
+    def load_user_by_id(user_id, profile=None):
+        return with_loading_profile(User.query, User, profile).filter(User.id == user_id).first()
+
+    #columns of the signed in user cached across requests, see load_user_snapshot
+    snapshot_columns = ('id', 'role_id', 'username', 'email', 'password_hash', 'account_confirmed',
+                        'about_me', 'avatar_hash')
+
+    @staticmethod
+    def load_user_snapshot(user_id):
+        """
+        the signed in user of the request attached to the session from the (auth_user) cache without
+        querying the database. the columns left out of the snapshot (counters, feed and api state)
+        change without the user's involvement and are loaded on first access. snapshots are dropped
+        when their columns are written (see forget_user_snapshots), other worker processes
+        pick the changes up once their snapshot expires
+        """
+        def build_snapshot():
+            user = User.load_user_by_id(user_id, profile='auth')
+            if user is None:
+                return None
+            return {column: getattr(user, column) for column in User.snapshot_columns}
+        #merging would overwrite the state of the user already loaded by the session
+        user = app_database.session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            return user
+        snapshot = get_app_cache('auth_user').get_or_build(user_id, build_snapshot)
+        if snapshot is None:
+            return None
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return app_database.session.merge(user, load=False)
 
     @property
     def password(self):
@@ -224,9 +852,14 @@ class User(UserMixin, app_database.Model):
         app_database.session.add(self)
         return True
 
+    def get_role_id(self):
+        #users that were not flushed yet only reference their role through the relationship
+        if self.role_id is None and self.__dict__.get('role') is not None:
+            return self.__dict__['role'].id
+        return self.role_id
+
     def has_permissions(self, permissions):
-        return self.role is not None and \
-                        self.role.permissions & permissions == permissions
+        return Role.get_permissions(self.get_role_id()) & permissions == permissions
     
     def is_admin(self):
         return self.has_permissions(AppPermissions.ADMINISTER)
@@ -236,88 +869,341 @@ class User(UserMixin, app_database.Model):
         self.avatar_hash = hashlib.md5(self.email.encode('utf-8')).hexdigest()
         app_database.session.add(self)
 
-    def generate_gravatar_uri(self, size=100, default='identicon'):
-        if not self.avatar_hash:
-            self.avatar_hash = hashlib.md5(self.email.encode('utf-8')).hexdigest()
-        avatar_uri = 'http://www.gravatar.com/avatar'
-        return '{avatar_uri}/{hash}?s={size}&d={default}'.format(avatar_uri=avatar_uri,
-                                                                 hash=self.avatar_hash,
-                                                                 size=size,
-                                                                 default=default)
+    def get_profile_version(self, viewer):
+        """
+        digest of everything the profile page of the user shows to (viewer): the user's header
+        and counters, the viewer's navigation bar and the follow relationship between them
+        """
+        profile_state = (self.id, self.username, self.about_me, self.generate_gravatar_uri(),
+                         self.followers_count, self.followed_users_count,
+                         self.answered_questions_count, self.unanswered_questions_count,
+                         viewer.id, viewer.username, viewer.is_admin(),
+                         viewer.is_following(self), viewer.is_followed_by(self))
+        return hashlib.sha1(repr(profile_state).encode('utf-8')).hexdigest()
+
+    @property
+    def role_name(self):
+        return Role.get_role_name(self.get_role_id())
+
+    def update_counters(self, **deltas):
+        """
+        adds the deltas to the user's counters with a single UPDATE in the current transaction,
+        so that concurrent updates of the same counters are never lost
+        """
+        User.query.filter(User.id == self.id).update({getattr(User, counter): getattr(User, counter) + delta
+                                                      for counter, delta in deltas.items()},
+                                                     synchronize_session=False)
+        app_database.session.expire(self, list(deltas))
 
     def ask_question(self, question_content, question_recipient):
         question = Question(question_content=question_content, asker=self, replier=question_recipient)
         app_database.session.add(question)
+        question_recipient.update_counters(unanswered_questions_count=1)
     
     def answer_question(self, answer_content, question):
+        if not question.has_answer:
+            self.update_counters(answered_questions_count=1, unanswered_questions_count=-1)
         question.has_answer = True
-        answer = Answer(answer_content=answer_content, question=question)
+        answer = Answer(answer_content=answer_content, question=question,
+                        timestamp=datetime.datetime.utcnow())
         app_database.session.add(answer)
+        TimelineEntry.fan_out(question=question, author=self, answered_at=answer.timestamp)
 
     def is_question_replier(self, question):
-        if self.id == question.replier.id:
+        if self.id == question.replier_id:
             return True
         return False
 
     def is_question_asker(self, question):
-        if self.id == question.asker.id:
+        if self.id == question.asker_id:
             return True
         return False
 
-    def get_unanswered_questions(self, questions_limit=None):
-        unanswered_questions = []
-        if questions_limit is None or questions_limit < 0:
-            questions_limit = self.in_questions.filter(Question.has_answer.is_(False)).count()
-        for question in (self.in_questions
-                             .filter(Question.has_answer.is_(False))
-                             .order_by(Question.timestamp.desc())
-                             .limit(questions_limit).all()):
-            unanswered_questions.append(question)
-        return unanswered_questions
-
-    def get_answered_questions(self, questions_limit=None):
-        answered_questions = []
-        if questions_limit is None or questions_limit < 0:
-            questions_limit = self.in_questions.filter(Question.has_answer.is_(True)).count()
-        for question in (self.in_questions
-                             .filter(Question.has_answer.is_(True))
-                             .order_by(Question.timestamp.desc())
-                             .limit(questions_limit).all()):
-            answered_questions.append(question)
-        return answered_questions
+    def get_unanswered_questions(self, questions_limit=None, profile=None):
+        questions = (with_loading_profile(self.in_questions, Question, profile)
+                         .filter(Question.has_answer.is_(False))
+                         .order_by(Question.timestamp.desc()))
+        if questions_limit is not None and questions_limit >= 0:
+            questions = questions.limit(questions_limit)
+        return questions.all()
+
+    def get_answered_questions(self, questions_limit=None, profile=None):
+        questions = (with_loading_profile(self.in_questions, Question, profile)
+                         .filter(Question.has_answer.is_(True))
+                         .order_by(Question.timestamp.desc()))
+        if questions_limit is not None and questions_limit >= 0:
+            questions = questions.limit(questions_limit)
+        return questions.all()
+
+    def get_unanswered_questions_page(self, page, questions_per_page):
+        """a page of the cards of the user's unanswered questions and whether there is a next page"""
+        return paginate_without_count(Question.select_cards()
+                                              .where(and_(Question.replier_id == self.id,
+                                                          Question.has_answer.is_(False)))
+                                              .order_by(Question.timestamp.desc()),
+                                      page, questions_per_page, load=Question.load_cards)
+
+    def get_answered_questions_page(self, page, questions_per_page):
+        """
+        a page of the cards of the user's answered questions and whether there is a next page,
+        once the hot questions are exhausted the pages continue into the user's archived questions
+        """
+        page = max(page, 1)
+        cards, has_next = paginate_without_count(Question.select_cards()
+                                                         .where(and_(Question.replier_id == self.id,
+                                                                     Question.has_answer.is_(True)))
+                                                         .order_by(Question.timestamp.desc()),
+                                                 page, questions_per_page, load=Question.load_cards)
+        if has_next:
+            return cards, has_next
+        archive_offset = 0
+        if not cards:
+            #pages past the hot questions are rare enough to count them
+            hot_questions_count = (app_database.session.query(func.count(Question.id))
+                                                       .filter(Question.replier_id == self.id,
+                                                               Question.has_answer.is_(True))
+                                                       .scalar())
+            archive_offset = (page - 1) * questions_per_page - hot_questions_count
+        archived_limit = questions_per_page - len(cards)
+        archived_cards = ArchivedQuestion.load_cards(ArchivedQuestion.select_cards()
+                                                                     .where(ArchivedQuestion.replier_id == self.id)
+                                                                     .order_by(ArchivedQuestion.timestamp.desc())
+                                                                     .offset(archive_offset)
+                                                                     .limit(archived_limit + 1))
+        return cards + archived_cards[:archived_limit], len(archived_cards) > archived_limit
+
+    def get_followers_page(self, page, users_per_page, order_by=None):
+        """a page of the summaries of the user's followers, most recent first, and whether there is a next page"""
+        return paginate_without_count(User.select_summaries(follows_column=Follow.follower_id)
+                                          .where(Follow.followed_id == self.id)
+                                          .order_by(Follow.timestamp.desc() if order_by is None else order_by),
+                                      page, users_per_page, load=User.load_summaries)
+
+    def get_followed_users_page(self, page, users_per_page, order_by=None):
+        """a page of the summaries of the users followed by the user, most recent first, and whether there is a next page"""
+        return paginate_without_count(User.select_summaries(follows_column=Follow.followed_id)
+                                          .where(Follow.follower_id == self.id)
+                                          .order_by(Follow.timestamp.desc() if order_by is None else order_by),
+                                      page, users_per_page, load=User.load_summaries)
 
     def follow(self, user):
         if self.id != user.id:
             if not self.is_following(user):
                 follow = Follow(follower_id=self.id, followed_id=user.id)
                 app_database.session.add(follow)
+                self.update_counters(followed_users_count=1)
+                user.update_counters(followers_count=1)
+                clear_request_memo()
+                TimelineEntry.push_author_questions(
+                    owner=self, author=user,
+                    questions_limit=current_app.config['HOME_FEED_QUESTIONS_PER_FOLLOWED_USER'])
+                invalidate_on_commit(app_database.session, 'home_feed', self.id)
 
     def unfollow(self, user):
         followed = self.follows.filter(Follow.followed_id == user.id).first()
         if followed:
             app_database.session.delete(followed)
+            self.update_counters(followed_users_count=-1)
+            user.update_counters(followers_count=-1)
+            clear_request_memo()
+            TimelineEntry.remove_author_questions(owner=self, author=user)
+            invalidate_on_commit(app_database.session, 'home_feed', self.id)
 
+    @request_memoized
     def is_following(self, user):
         if self.follows.filter(Follow.followed_id == user.id).first():
             return True
         return False
     
+    @request_memoized
     def is_followed_by(self, user):
         if self.followed_by.filter(Follow.follower_id == user.id).first():
             return True
         return False
 
-    def get_followers_list(self):
-        followers_list = []
-        for follow in self.followed_by.all():
-            followers_list.append(follow.follower)
-        return followers_list
-    
-    def get_followed_users_list(self):
-        followed_list = []
-        for follow in self.follows.all():
-            followed_list.append(follow.followed)
-        return followed_list
+    def get_follow_states(self, users_ids):
+        """
+        the follow relationship between the user and every user of (users_ids) loaded with a single
+        query, returns the set of ids the user follows and the set of ids following the user
+        """
+        following_ids, followers_ids = set(), set()
+        users_ids = set(users_ids)
+        if not users_ids:
+            return following_ids, followers_ids
+        for follower_id, followed_id in (app_database.session
+                                             .query(Follow.follower_id, Follow.followed_id)
+                                             .filter(or_(and_(Follow.follower_id == self.id,
+                                                              Follow.followed_id.in_(users_ids)),
+                                                         and_(Follow.followed_id == self.id,
+                                                              Follow.follower_id.in_(users_ids))))):
+            if follower_id == self.id:
+                following_ids.add(followed_id)
+            if followed_id == self.id:
+                followers_ids.add(follower_id)
+        return following_ids, followers_ids
+
+    def is_high_follower_account(self):
+        """answers of high follower accounts are pulled into the home feeds instead of being pushed"""
+        return self.followers_count > current_app.config['HOME_FEED_FANOUT_MAX_FOLLOWERS']
+
+    @request_memoized
+    def get_high_follower_followed_users_ids(self):
+        return set(user_id for user_id, in (app_database.session
+                                                .query(Follow.followed_id)
+                                                .join(User, User.id == Follow.followed_id)
+                                                .filter(Follow.follower_id == self.id,
+                                                        User.followers_count >
+                                                        current_app.config['HOME_FEED_FANOUT_MAX_FOLLOWERS'])))
+
+    def prewarm_home_feed(self):
+        """
+        builds the timeline of users who don't have one yet, otherwise re-ranks the entries of its
+        first HOME_FEED_PREWARM_PAGES pages since their follow age and affinity bonuses were computed
+        when they were written. runs in the celery workers, the pages cached by the web processes
+        pick the new ranking up when their ttl expires
+        """
+        if self.timeline.first() is None:
+            self.rebuild_timeline()
+            return
+        config = current_app.config
+        ranking_bonuses = TimelineEntry.load_ranking_bonuses(owner_id=self.id)
+        app_database.session.bulk_update_mappings(TimelineEntry, [
+            {'id': entry_id,
+             'score': TimelineEntry.rank(answered_at, ranking_bonuses.get((self.id, author_id), 0))}
+            for entry_id, author_id, answered_at in (app_database.session
+                                                         .query(TimelineEntry.id, TimelineEntry.author_id,
+                                                                TimelineEntry.timestamp)
+                                                         .filter(TimelineEntry.owner_id == self.id)
+                                                         .order_by(TimelineEntry.score.desc(),
+                                                                   TimelineEntry.question_id.desc())
+                                                         .limit(config['HOME_FEED_PREWARM_PAGES'] *
+                                                                config['HOME_FEED_QUESTIONS_PER_PAGE']))
+        ])
+
+    def get_home_feed_page(self, cursor=None, lazy=False):
+        """
+        get_timeline_page with the default page size, the ids of the first page are cached per user
+        and per worker process (answers of followed high follower accounts, and the follows and
+        answers committed by other processes, reach the cached page when its ttl expires).
+        the cards of a (lazy) first page are fetched while they are rendered, see Question.iter_cards
+        """
+        if cursor is not None:
+            return self.get_timeline_page(cursor=cursor)
+        questions_ids, next_cursor = get_app_cache('home_feed').get_or_build(self.id, self.get_timeline_page_ids)
+        return Question.load_cards_by_ids(questions_ids, lazy=lazy), next_cursor
+
+    def query_feed_arrivals(self, after=None):
+        """
+        queries of the (arrival timestamp, question id) of the questions that reached the home timeline
+        after (after), a (timestamp, question id) pair: the pushed timeline entries and the answered
+        questions of the followed high follower accounts. returns (query, timestamp column, id column) tuples
+        """
+        pulled_users_ids = self.get_high_follower_followed_users_ids()
+        pushed_entries = (app_database.session.query(TimelineEntry.timestamp, TimelineEntry.question_id)
+                                              .filter(TimelineEntry.owner_id == self.id))
+        if pulled_users_ids:
+            pushed_entries = pushed_entries.filter(TimelineEntry.author_id.notin_(pulled_users_ids))
+        arrivals = [(pushed_entries, TimelineEntry.timestamp, TimelineEntry.question_id)]
+        if pulled_users_ids:
+            answered_at = func.coalesce(Answer.timestamp, Question.timestamp)
+            arrivals.append((app_database.session.query(answered_at, Question.id)
+                                                 .join(Answer, Answer.question_id == Question.id)
+                                                 .filter(Question.replier_id.in_(pulled_users_ids),
+                                                         Question.has_answer.is_(True)),
+                             answered_at, Question.id))
+        if after is None:
+            return arrivals
+        timestamp, question_id = after
+        return [(query.filter(or_(arrived_at > timestamp,
+                                  and_(arrived_at == timestamp, arrived_question_id > question_id))),
+                 arrived_at, arrived_question_id)
+                for query, arrived_at, arrived_question_id in arrivals]
+
+    def get_feed_seen_marker(self):
+        if self.last_feed_seen_at is None:
+            return None
+        return self.last_feed_seen_at, self.last_feed_seen_question_id or 0
+
+    def get_new_timeline_questions(self, questions_limit=None, since=None):
+        """
+        answered questions that reached the home timeline after the user's seen marker, or after the
+        (since) marker when it is newer (the newest question of the home page the client shows),
+        returns the (questions_limit) oldest of them newest first, the number of new questions and the
+        (timestamp, question id) of the newest returned question to pass to mark_feed_seen
+        (None when nothing is new). feeds that were never seen start with their newest questions
+        """
+        if questions_limit is None or questions_limit < 1:
+            questions_limit = current_app.config['HOME_FEED_QUESTIONS_PER_PAGE']
+        markers = [marker for marker in (self.get_feed_seen_marker(), since) if marker is not None]
+        after = max(markers) if markers else None
+        arrivals = self.query_feed_arrivals(after=after)
+        new_questions_count = sum(query.count() for query, arrived_at, arrived_question_id in arrivals)
+        entries = []
+        for query, arrived_at, arrived_question_id in arrivals:
+            if after is None:
+                query = query.order_by(arrived_at.desc(), arrived_question_id.desc())
+            else:
+                query = query.order_by(arrived_at, arrived_question_id)
+            entries += query.limit(questions_limit).all()
+        if after is None:
+            entries = sorted(entries, reverse=True)[:questions_limit]
+        else:
+            entries = sorted(entries)[:questions_limit][::-1]
+        questions = Question.load_cards_by_ids([question_id for arrived_at, question_id in entries])
+        return questions, new_questions_count, tuple(entries[0]) if entries else None
+
+    def get_feed_marker(self):
+        """the (timestamp, question id) of the newest question of the home timeline, None if it is empty"""
+        entries = [query.order_by(arrived_at.desc(), arrived_question_id.desc()).first()
+                   for query, arrived_at, arrived_question_id in self.query_feed_arrivals()]
+        entries = [tuple(entry) for entry in entries if entry is not None]
+        return max(entries) if entries else None
+
+    def mark_feed_seen(self, seen_entry):
+        """moves the user's seen marker to (seen_entry), a (timestamp, question id) pair, committed by the view"""
+        self.last_feed_seen_at, self.last_feed_seen_question_id = seen_entry
+        app_database.session.add(self)
+
+    def get_timeline_page(self, cursor=None, questions_per_page=None):
+        """the cards of a page of the home timeline and the cursor of the next page, see get_timeline_page_ids"""
+        questions_ids, next_cursor = self.get_timeline_page_ids(cursor=cursor, questions_per_page=questions_per_page)
+        return Question.load_cards_by_ids(questions_ids), next_cursor
+
+    def get_timeline_page_ids(self, cursor=None, questions_per_page=None):
+        """
+        one page of the home timeline ordered by the precomputed ranking score, keyed on
+        (score, question id), returns the page's questions ids and the cursor of the next page
+        (None on the last page)
+
+        the materialized timeline entries are merged with the answered questions of the
+        followed high follower accounts, which are read from the questions table and ranked
+        with the same scoring at read time
+        """
+        if questions_per_page is None or questions_per_page < 1:
+            questions_per_page = current_app.config['HOME_FEED_QUESTIONS_PER_PAGE']
+        after = TimelineEntry.load_cursor(cursor) if cursor is not None else None
+        pulled_users_ids = self.get_high_follower_followed_users_ids()
+        entries = (app_database.session.query(TimelineEntry.score, TimelineEntry.question_id)
+                                       .filter(TimelineEntry.owner_id == self.id))
+        if pulled_users_ids:
+            #entries pushed before their author crossed the fan-out threshold
+            entries = entries.filter(TimelineEntry.author_id.notin_(pulled_users_ids))
+        if after is not None:
+            score, question_id = after
+            entries = entries.filter(or_(TimelineEntry.score < score,
+                                         and_(TimelineEntry.score == score,
+                                              TimelineEntry.question_id < question_id)))
+        entries = (entries.order_by(TimelineEntry.score.desc(), TimelineEntry.question_id.desc())
+                          .limit(questions_per_page + 1).all())
+        if pulled_users_ids:
+            entries += TimelineEntry.rank_pulled_questions(owner=self, authors_ids=pulled_users_ids,
+                                                           after=after, entries_limit=questions_per_page + 1)
+            entries = sorted(entries, reverse=True)[:questions_per_page + 1]
+        next_cursor = None
+        if len(entries) > questions_per_page:
+            score, question_id = entries[questions_per_page - 1]
+            next_cursor = TimelineEntry.dump_cursor(score, question_id)
+        return [question_id for score, question_id in entries[:questions_per_page]], next_cursor
 
     @staticmethod
     def api_load_user_from_auth_token(auth_token):
@@ -330,13 +1216,16 @@ class User(UserMixin, app_database.Model):
             token_payload = token_verify.loads(auth_token)
         except BadSignature:
             return None
-        return User.load_user_by_id(token_payload.get('auth_token_id', ''))
+        return User.load_user_by_id(token_payload.get('auth_token_id', ''), profile='auth')
 
-    def api_generate_auth_token(self, expires_in=TokenExpirationTime.AFTER_15_MIN):
+    def api_create_auth_token(self, expires_in=TokenExpirationTime.AFTER_15_MIN):
         token_gen = TimedJSONWebSignatureSerializer(current_app.config['SECRET_KEY'],
                                                     expires_in=expires_in)
         token_payload = {'auth_token_id': self.id}
-        self.api_auth_token = token_gen.dumps(token_payload).decode()
+        return token_gen.dumps(token_payload).decode()
+
+    def api_generate_auth_token(self, expires_in=TokenExpirationTime.AFTER_15_MIN):
+        self.api_auth_token = self.api_create_auth_token(expires_in=expires_in)
         app_database.session.add(self)
         app_database.session.commit()
 
@@ -347,65 +1236,68 @@ class User(UserMixin, app_database.Model):
         }
         return jsonify(auth_token_data)
 
-    def api_get_user_info(self):
-        user_info = {
-            'id': self.id,
-            'username': self.username,
-            'about_me': self.about_me,
-            'avatar_uri': self.generate_gravatar_uri(),
-            '#followers': self.followed_by.count(),
-            '#following': self.follows.count(),
-            'followers': url_for('api.api_get_followers_list', username=self.username,
-                                 p=1,
-                                 _external=True),
-            'following': url_for('api.api_get_followed_users_list', username=self.username,
-                                 p=1,
-                                 _external=True),
-            'account_confirmed': self.account_confirmed,
-            'role': self.role.role_name,
-            'status_code': 200
-        }
-        return user_info
+    @staticmethod
+    def select_summaries(follows_column=None):
+        """
+        core select of the columns of UserSummary records, filter and order it then pass it to
+        load_summaries. with (follows_column) the users are the ones referenced by that column
+        of the follows table
+        """
+        users, roles = User.__table__, Role.__table__
+        users_from = users if follows_column is None else Follow.__table__.join(users, users.c.id == follows_column)
+        return (select([users.c.id, users.c.username, users.c.email, users.c.avatar_hash, users.c.about_me,
+                        users.c.account_confirmed, roles.c.role_name,
+                        users.c.followers_count, users.c.followed_users_count])
+                    .select_from(users_from.outerjoin(roles, roles.c.id == users.c.role_id)))
+
+    @staticmethod
+    def load_summaries(statement):
+        return [UserSummary(row) for row in app_database.session.execute(statement)]
 
     @staticmethod
-    def api_get_users_list_json(page, users_per_page):
-        users = User.query.paginate(page, users_per_page, False)
+    def api_get_users_list_json(page, users_per_page, viewer):
+        users, has_next = paginate_without_count(User.select_summaries().order_by(User.id),
+                                                 page, users_per_page, load=User.load_summaries)
         next_users_list_uri = url_for('api.api_get_users_list', 
                                       n=users_per_page,
                                       p=page + 1,
-                                      _external=True) if users.has_next else 'NULL'
+                                      _external=True) if has_next else 'NULL'
+        follow_states = viewer.get_follow_states(user.id for user in users)
         users_list = {
-            'users': [user.api_get_user_info() for user in users.items],
+            'users': [user.api_get_user_info(follow_states=follow_states) for user in users],
             'next': next_users_list_uri,
             'status_code': 200
         }
         return jsonify(users_list)
     
     @staticmethod
-    def api_get_followers_list_json(user, page, followers_per_page):
-        follow = user.followed_by.paginate(page, followers_per_page, False)
+    def api_get_followers_list_json(user, page, followers_per_page, viewer):
+        followers, has_next = user.get_followers_page(page, followers_per_page, order_by=Follow.id)
         next_followers_uri = url_for('api.api_get_followers_list', 
                                      username=user.username,
                                      n=followers_per_page,
                                      p=page + 1,
-                                     _external=True) if follow.has_next else 'NULL'
+                                     _external=True) if has_next else 'NULL'
+        follow_states = viewer.get_follow_states(follower.id for follower in followers)
         followers_list = {
-            'followers': [follow.follower.api_get_user_info() for follow in follow.items],
+            'followers': [follower.api_get_user_info(follow_states=follow_states) for follower in followers],
             'next': next_followers_uri,
             'status_code': 200
         }
         return jsonify(followers_list)
 
     @staticmethod
-    def api_get_followed_users_list_json(user, page, followed_users_per_page):
-        follow = user.follows.paginate(page, followed_users_per_page, False)
+    def api_get_followed_users_list_json(user, page, followed_users_per_page, viewer):
+        followed_users, has_next = user.get_followed_users_page(page, followed_users_per_page, order_by=Follow.id)
         next_followed_users_uri = url_for('api.api_get_followed_users_list',
                                           username=user.username,
                                           n=followed_users_per_page,
                                           p=page + 1,
-                                          _external=True) if follow.has_next else 'NULL'
+                                          _external=True) if has_next else 'NULL'
+        follow_states = viewer.get_follow_states(followed_user.id for followed_user in followed_users)
         followed_users_list = {
-            'following': [follow.followed.api_get_user_info() for follow in follow.items],
+            'following': [followed_user.api_get_user_info(follow_states=follow_states)
+                          for followed_user in followed_users],
             'next': next_followed_users_uri,
             'status_code': 200
         }
@@ -424,19 +1316,47 @@ class User(UserMixin, app_database.Model):
         }
         return question_info
 
+    @staticmethod
+    def api_get_home_feed_json(user, cursor, questions_per_page):
+        if questions_per_page == current_app.config['HOME_FEED_QUESTIONS_PER_PAGE']:
+            questions, next_cursor = user.get_home_feed_page(cursor=cursor)
+        else:
+            questions, next_cursor = user.get_timeline_page(cursor=cursor, questions_per_page=questions_per_page)
+        next_questions_uri = url_for('api.api_get_home_feed',
+                                     n=questions_per_page,
+                                     c=next_cursor,
+                                     _external=True) if next_cursor else 'NULL'
+        home_feed = {
+            'questions': [User.api_get_question_info(q) for q in questions],
+            'next': next_questions_uri,
+            'status_code': 200
+        }
+        return jsonify(home_feed)
+
+    @staticmethod
+    def api_get_new_home_feed_questions_json(user, questions_limit):
+        """also moves the user's seen marker past the returned questions, committed by the view"""
+        questions, new_questions_count, newest_entry = \
+                user.get_new_timeline_questions(questions_limit=questions_limit)
+        if newest_entry is not None:
+            user.mark_feed_seen(newest_entry)
+        new_home_feed_questions = {
+            'questions': [User.api_get_question_info(q) for q in questions],
+            'count': new_questions_count,
+            'status_code': 200
+        }
+        return jsonify(new_home_feed_questions)
+
     @staticmethod
     def api_get_answered_questions_json(user, page, questions_per_page):
-        questions = (user.in_questions
-                         .filter(Question.has_answer.is_(True))
-                         .order_by(Question.timestamp.desc())
-                         .paginate(page, questions_per_page, False))
+        questions, has_next = user.get_answered_questions_page(page, questions_per_page)
         next_questions_uri = url_for('api.api_get_user_answered_questions',
                                      username=user.username,
                                      n=questions_per_page,
                                      p=page + 1,
-                                     _external=True) if questions.has_next else 'NULL'
+                                     _external=True) if has_next else 'NULL'
         answered_questions_list = {
-            'answered_questions': [User.api_get_question_info(q) for q in questions.items],
+            'answered_questions': [User.api_get_question_info(q) for q in questions],
             'next': next_questions_uri,
             'status_code': 200
         }
@@ -444,18 +1364,28 @@ class User(UserMixin, app_database.Model):
 
     @staticmethod
     def api_get_unanswered_questions_json(user, page, questions_per_page):
-        questions = (user.in_questions
-                         .filter(Question.has_answer.is_(False))
-                         .order_by(Question.timestamp.desc())
-                         .paginate(page, questions_per_page, False))
+        questions, has_next = user.get_unanswered_questions_page(page, questions_per_page)
         next_questions_uri = url_for('api.api_get_user_unanswered_questions',
                                      username=user.username,
                                      n=questions_per_page,
                                      p=page + 1,
-                                     _external=True) if questions.has_next else 'NULL'
+                                     _external=True) if has_next else 'NULL'
         unanswered_questions_list = {
-            'unanswered_questions': [User.api_get_question_info(q) for q in questions.items],
+            'unanswered_questions': [User.api_get_question_info(q) for q in questions],
             'next': next_questions_uri,
             'status_code': 200
         }
-        return jsonify(unanswered_questions_list)
\ No newline at end of file
+        return jsonify(unanswered_questions_list)
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def forget_user_snapshots(session, flush_context):
+    #attributes history is still available, it is reset after the flush
+    users_ids = [user.id for user in session.deleted if isinstance(user, User)]
+    for user in session.dirty:
+        if isinstance(user, User):
+            user_state = inspect(user)
+            if any(user_state.attrs[column].history.has_changes() for column in User.snapshot_columns):
+                users_ids.append(user.id)
+    if users_ids:
+        invalidate_on_commit(session, 'auth_user', *users_ids)
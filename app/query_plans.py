@@ -0,0 +1,75 @@
+from collections import Counter
+from contextlib import contextmanager
+from sqlalchemy import event
+
+'''
+helpers to look at the plans the database picks for the statements emitted by the app
+'''
+
+
+@contextmanager
+def capture_statements(engine):
+    """collects the (statement, parameters) executed on the engine inside the with block"""
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain_statement(connection, statement, parameters):
+    """the lines of the plan of a statement, (EXPLAIN QUERY PLAN) on sqlite and (EXPLAIN) elsewhere"""
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.name == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def get_full_scans(plan):
+    """the lines of the plan reading a whole table instead of going through an index"""
+    return [line for line in plan
+            if (line.startswith('SCAN ') and ' USING ' not in line and
+                not line.startswith(('SCAN CONSTANT ROW', 'SCAN (', 'SCAN SUBQUERY'))) or
+               'Seq Scan' in line]
+
+
+def get_sorts(plan):
+    """the lines of the plan sorting rows that no index returns in the requested order"""
+    return [line for line in plan if 'USE TEMP B-TREE' in line or line.lstrip(' ->').startswith('Sort ')]
+
+
+def get_automatic_indexes(plan):
+    """the lines of the plan where sqlite builds a transient index, a sign of a missing one"""
+    return [line for line in plan if 'AUTOMATIC' in line and 'INDEX' in line]
+
+
+def diagnose_statements(connection, statements):
+    """
+    the findings about the statements captured while serving one request, as
+    (kind, detail, statement) tuples: full table scans, transient indexes and sorts in the
+    plans of the select statements and statements executed more than once with the same parameters
+    """
+    findings = []
+    executions = Counter((statement, repr(parameters)) for statement, parameters in statements)
+    explained = set()
+    for statement, parameters in statements:
+        key = (statement, repr(parameters))
+        if key in explained or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            continue
+        explained.add(key)
+        plan = explain_statement(connection, statement, parameters)
+        findings += [('full scan', line, statement) for line in get_full_scans(plan)]
+        findings += [('missing index', line, statement) for line in get_automatic_indexes(plan)]
+        findings += [('sort', line, statement) for line in get_sorts(plan)]
+    findings += [('repeated', 'executed {} times'.format(count), statement)
+                 for (statement, parameters), count in executions.items() if count > 1]
+    return findings
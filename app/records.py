@@ -0,0 +1,89 @@
+import hashlib
+from flask import url_for
+
+'''
+read only records of the rows listed by the feed, the profiles and the api (question cards and
+user summaries). they are built from sqlalchemy core rows (see Question.load_cards and
+User.load_summaries) so listing them costs no identity map, change tracking or relationship loading
+'''
+
+
+class UserSummaryMixin:
+    """behaviour shared by the User model and the UserSummary record"""
+    __slots__ = ()
+
+    def generate_gravatar_uri(self, size=100, default='identicon'):
+        if not self.avatar_hash:
+            self.avatar_hash = hashlib.md5(self.email.encode('utf-8')).hexdigest()
+        avatar_uri = 'http://www.gravatar.com/avatar'
+        return '{avatar_uri}/{hash}?s={size}&d={default}'.format(avatar_uri=avatar_uri,
+                                                                 hash=self.avatar_hash,
+                                                                 size=size,
+                                                                 default=default)
+
+    def api_get_user_info(self, follow_states=None):
+        user_info = {
+            'id': self.id,
+            'username': self.username,
+            'about_me': self.about_me,
+            'avatar_uri': self.generate_gravatar_uri(),
+            '#followers': self.followers_count,
+            '#following': self.followed_users_count,
+            'followers': url_for('api.api_get_followers_list', username=self.username,
+                                 p=1,
+                                 _external=True),
+            'following': url_for('api.api_get_followed_users_list', username=self.username,
+                                 p=1,
+                                 _external=True),
+            'account_confirmed': self.account_confirmed,
+            'role': self.role_name,
+            'status_code': 200
+        }
+        #follow_states of the requesting user, see User.get_follow_states
+        if follow_states is not None:
+            following_ids, followers_ids = follow_states
+            user_info['followed_by_you'] = self.id in following_ids
+            user_info['follows_you'] = self.id in followers_ids
+        return user_info
+
+
+class UserSummary(UserSummaryMixin):
+    __slots__ = ('id', 'username', 'email', 'avatar_hash', 'about_me', 'account_confirmed', 'role_name',
+                 'followers_count', 'followed_users_count')
+
+    def __init__(self, row, prefix=''):
+        """(prefix) is the prefix of the labels of the user's columns in (row)"""
+        for column in UserSummary.__slots__:
+            setattr(self, column, row[prefix + column] if prefix + column in row else None)
+
+
+class AnswerRecord:
+    __slots__ = ('id', 'answer_content', 'timestamp')
+
+    def __init__(self, id, answer_content, timestamp):
+        self.id = id
+        self.answer_content = answer_content
+        self.timestamp = timestamp
+
+
+class QuestionCard:
+    __slots__ = ('id', 'question_content', 'timestamp', 'has_answer', 'asker_id', 'replier_id',
+                 'asker', 'replier', 'answer')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.question_content = row['question_content']
+        self.timestamp = row['timestamp']
+        self.has_answer = row['has_answer']
+        self.asker_id = row['asker_id']
+        self.replier_id = row['replier_id']
+        self.asker = UserSummary(row, prefix='asker_') if row['asker_id'] is not None else None
+        self.replier = UserSummary(row, prefix='replier_') if row['replier_id'] is not None else None
+        self.answer = AnswerRecord(row['answer_id'], row['answer_content'], row['answer_timestamp']) \
+                                  if row['answer_id'] is not None else None
+
+    def get_answered_at(self):
+        #answers written before answers were timestamped are dated by their question
+        if self.answer is not None and self.answer.timestamp is not None:
+            return self.answer.timestamp
+        return self.timestamp
@@ -0,0 +1,107 @@
+import random, time
+from functools import wraps
+from flask import current_app, session, request, _request_ctx_stack
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm, event
+from sqlalchemy.sql.dml import UpdateBase
+
+'''
+units of work of the views. the views writing to the database commit explicitly, the others end
+with a rollback (SQLALCHEMY_COMMIT_ON_TEARDOWN is off), the views decorated with read_only never flush
+and run in a read only transaction.
+read replicas of the database (SQLALCHEMY_REPLICA_URIS) are registered as flask-sqlalchemy binds.
+the statements of the views decorated with reads_from_replica are sent to one of the replicas,
+writes and every statement following a write in the same session are sent to the primary database.
+users who wrote keep reading from the primary for DATABASE_REPLICA_LAG_SECONDS so that the pages
+following their writes (redirects) show them.
+the requests of the decorated views are flagged before any of their statements runs (the user
+loader and the before request hooks query too), the session transaction is then begun on the
+replica and read only
+'''
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            self.info['ama_wrote'] = True
+        request_ctx = _request_ctx_stack.top
+        replica_bind_key = request_ctx.__dict__.get('ama_replica_bind_key') if request_ctx is not None else None
+        if replica_bind_key is None or self._flushing or self.info.get('ama_wrote'):
+            return SignallingSession.get_bind(self, mapper, clause)
+        return get_state(self.app).db.get_engine(self.app, bind=replica_bind_key)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def stick_to_primary(session, flush_context):
+    session.info['ama_wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def begin_read_only_transaction(session, transaction, connection):
+    request_ctx = _request_ctx_stack.top
+    if request_ctx is not None and request_ctx.__dict__.get('ama_read_only') \
+                               and connection.dialect.name == 'postgresql':
+        connection.execute('SET TRANSACTION READ ONLY')
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def init_app_replicas(app):
+    replica_binds = {'ama_replica_{}'.format(i): replica_uri
+                     for i, replica_uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS'])}
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **replica_binds)
+    app.extensions['ama_replicas'] = sorted(replica_binds)
+    #registered before the blueprints so that it runs before their before request hooks
+    app.before_request(flag_view_request)
+    if replica_binds:
+        app.after_request(remember_primary_writes)
+
+
+def remember_primary_writes(response):
+    db_session = get_state(current_app).db.session
+    if db_session.info.get('ama_wrote') or db_session.new or db_session.dirty or db_session.deleted:
+        session['ama_primary_reads_until'] = time.time() + current_app.config['DATABASE_REPLICA_LAG_SECONDS']
+    return response
+
+
+def flag_request(view):
+    """flags the current request with the replica and read only markers of the view"""
+    request_ctx = _request_ctx_stack.top
+    if getattr(view, 'ama_read_only', False):
+        request_ctx.ama_read_only = True
+    if getattr(view, 'ama_reads_from_replica', False) and 'ama_replica_bind_key' not in request_ctx.__dict__:
+        replica_bind_keys = current_app.extensions['ama_replicas']
+        if replica_bind_keys and session.get('ama_primary_reads_until', 0) < time.time():
+            request_ctx.ama_replica_bind_key = random.choice(replica_bind_keys)
+        else:
+            request_ctx.ama_replica_bind_key = None
+
+
+def flag_view_request():
+    view = current_app.view_functions.get(request.endpoint)
+    if view is not None:
+        flag_request(view)
+
+
+def reads_from_replica(view):
+    """the view only reads, its statements can be sent to a replica"""
+    @wraps(view)
+    def view_wrapper(*args, **kwargs):
+        flag_request(view_wrapper)
+        return view(*args, **kwargs)
+    view_wrapper.ama_reads_from_replica = True
+    return view_wrapper
+
+
+def read_only(view):
+    """the view never writes, the session is not flushed and its transactions are read only"""
+    @wraps(view)
+    def view_wrapper(*args, **kwargs):
+        flag_request(view_wrapper)
+        with get_state(current_app).db.session.no_autoflush:
+            return view(*args, **kwargs)
+    view_wrapper.ama_read_only = True
+    return view_wrapper
@@ -0,0 +1,51 @@
+import datetime
+from flask import current_app
+from app import app_celery, app_database
+from .models import User, Question, TimelineEntry
+
+'''
+background tasks other than sending emails, routed to the (low_priority) queue
+(see the task_routes in app/__init__.py)
+'''
+
+
+@app_celery.task(ignore_result=True)
+def prewarm_home_feed(user_id):
+    '''prepares the user's home feed between signing in and requesting the home page'''
+    user = User.load_user_by_id(user_id)
+    if not user:
+        return
+    user.prewarm_home_feed()
+    app_database.session.commit()
+
+
+@app_celery.task(ignore_result=True)
+def reconcile_user_counters():
+    '''fixes drifted user counters, run periodically by celery beat (see celeryw.py), one transaction per batch'''
+    users_limit = current_app.config['USER_COUNTERS_RECONCILIATION_BATCH_SIZE']
+    last_user_id = 0
+    while last_user_id is not None:
+        last_user_id = User.reconcile_counters(after_user_id=last_user_id, users_limit=users_limit)
+        app_database.session.commit()
+
+
+@app_celery.task(ignore_result=True)
+def trim_timelines():
+    '''caps the size of the home timelines, run periodically by celery beat (see celeryw.py), one transaction per batch'''
+    owners_limit = current_app.config['HOME_FEED_TIMELINE_TRIM_BATCH_SIZE']
+    last_owner_id = 0
+    while last_owner_id is not None:
+        last_owner_id = TimelineEntry.trim_timelines(after_owner_id=last_owner_id, owners_limit=owners_limit)
+        app_database.session.commit()
+
+
+@app_celery.task(ignore_result=True)
+def archive_answered_questions():
+    '''moves the old answered questions to the archive, run periodically by celery beat (see celeryw.py), one transaction per batch'''
+    asked_before = datetime.datetime.utcnow() - datetime.timedelta(days=current_app.config['QUESTIONS_ARCHIVE_AGE_DAYS'])
+    questions_limit = current_app.config['QUESTIONS_ARCHIVE_BATCH_SIZE']
+    archived_questions_count = questions_limit
+    while archived_questions_count == questions_limit:
+        archived_questions_count = Question.archive_answered_questions(asked_before=asked_before,
+                                                                       questions_limit=questions_limit)
+        app_database.session.commit()
@@ -1,7 +1,23 @@
 import os
 from app import create_app, app_celery
 from app.email import send_mail
+from app.tasks import prewarm_home_feed, reconcile_user_counters, trim_timelines, archive_answered_questions
 from confg import app_config
 
 app = create_app(app_config[os.environ.get('APPLICATION_STATE')])
-app.app_context().push()
\ No newline at end of file
+app.app_context().push()
+
+app_celery.conf.beat_schedule = {
+    'reconcile-user-counters': {
+        'task': 'app.tasks.reconcile_user_counters',
+        'schedule': app.config['USER_COUNTERS_RECONCILIATION_INTERVAL'],
+    },
+    'trim-timelines': {
+        'task': 'app.tasks.trim_timelines',
+        'schedule': app.config['HOME_FEED_TIMELINE_TRIM_INTERVAL'],
+    },
+    'archive-answered-questions': {
+        'task': 'app.tasks.archive_answered_questions',
+        'schedule': app.config['QUESTIONS_ARCHIVE_INTERVAL'],
+    },
+}
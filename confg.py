@@ -9,8 +9,12 @@ class TokenExpirationTime:
 
 class AppConfig:
     SECRET_KEY = os.environ.get('SECRET_KEY')
-    SQLALCHEMY_COMMIT_ON_TEARDOWN = True
+    #views writing to the database commit explicitly (see app/replicas.py)
+    SQLALCHEMY_COMMIT_ON_TEARDOWN = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    #comma separated read replicas of the database, read by the views decorated with reads_from_replica
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URIS', '').split(', ') if uri]
+    DATABASE_REPLICA_LAG_SECONDS = 5
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = os.environ.get('MAIL_PORT')
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS')
@@ -25,6 +29,39 @@ class AppConfig:
     API_FOLLOWED_USERS_PER_PAGE = API_FOLLOWERS_PER_PAGE
     API_ANSWERED_QUESTIONS_PER_PAGE = 20
     API_UNANSWERED_QUESTIONS_PER_PAGE = API_ANSWERED_QUESTIONS_PER_PAGE
+    QUESTION_CARD_CACHE_TTL = 60 * 60
+    QUESTION_CARD_CACHE_SIZE = 20000
+    PROFILE_PAGE_CACHE_TTL = 10 * 60
+    PROFILE_PAGE_CACHE_SIZE = 5000
+    AUTH_USER_CACHE_TTL = 60
+    AUTH_USER_CACHE_SIZE = 10000
+    PROFILE_QUESTIONS_PER_PAGE = 20
+    PROFILE_USERS_PER_PAGE = 30
+    USER_COUNTERS_RECONCILIATION_INTERVAL = 60 * 60
+    USER_COUNTERS_RECONCILIATION_BATCH_SIZE = 500
+    QUESTIONS_ARCHIVE_AGE_DAYS = 365
+    QUESTIONS_ARCHIVE_BATCH_SIZE = 500
+    QUESTIONS_ARCHIVE_INTERVAL = 24 * 60 * 60
+    QUESTIONS_ARCHIVE_COMPRESS_MIN_BYTES = 256
+    STREAM_HTML_PAGES = True
+    RAISE_ON_LAZY_LOAD = False
+    HOME_FEED_QUESTIONS_PER_FOLLOWED_USER = 5
+    HOME_FEED_QUESTIONS_PER_PAGE = 20
+    HOME_FEED_FANOUT_MAX_FOLLOWERS = 10000
+    HOME_FEED_TIMELINE_MAX_ENTRIES = 1000
+    HOME_FEED_TIMELINE_TRIM_INTERVAL = 60 * 60
+    HOME_FEED_TIMELINE_TRIM_BATCH_SIZE = 500
+    HOME_FEED_BACKFILL_BATCH_SIZE = 100
+    HOME_FEED_RANK_FOLLOW_AGE_WEIGHT = 60
+    HOME_FEED_RANK_MAX_FOLLOW_AGE_DAYS = 365
+    HOME_FEED_RANK_AFFINITY_WEIGHT = 1800
+    HOME_FEED_RANK_MAX_AFFINITY = 10
+    #per worker process (see app/cache.py), other workers see follows and answers once it expires
+    HOME_FEED_CACHE_TTL = 15
+    HOME_FEED_CACHE_SIZE = 10000
+    HOME_FEED_PREWARM_ON_SIGNIN = True
+    HOME_FEED_PREWARM_PAGES = 2
+    API_HOME_FEED_QUESTIONS_PER_PAGE = HOME_FEED_QUESTIONS_PER_PAGE
 
 class AppDevelopmentConfig(AppConfig):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URI')
@@ -36,9 +73,15 @@ class AppTestingConfig(AppConfig):
     MAIL_TEST_SUBJECT = 'AMA-mail-testing'
     MAIL_TEST_TEMPLATE = 'email/mail_test.txt'
     ADMIN_MAIL_LIST = ['admin@mail.com']
+    HOME_FEED_PREWARM_ON_SIGNIN = False
+    #streamed responses pop their own request context, which clashes with context preserving test clients
+    STREAM_HTML_PAGES = False
+    #relationships left out of the loading profile picked by a view raise instead of lazy loading
+    RAISE_ON_LAZY_LOAD = True
     RECAPTCHA_PUBLIC_KEY = '6LeIxAcTAAAAAJcZVRqyHh71UMIEGNQ_MXjiZKhI'
     RECAPTCHA_PRIVATE_KEY = '6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe'
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URI')
+    SQLALCHEMY_REPLICA_URIS = []
 
 class AppProductionConfig(AppConfig):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
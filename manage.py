@@ -1,6 +1,9 @@
 import os, unittest, random
+from flask import url_for
+from flask_login import COOKIE_NAME, encode_cookie
 from app import create_app, app_database
-from app.models import User, Role, Question, Answer, AppPermissions, Follow
+from app.models import User, Role, Question, Answer, AppPermissions, Follow, TimelineEntry
+from app.query_plans import capture_statements, diagnose_statements
 from confg import app_config
 
 
@@ -36,7 +39,64 @@ def generate_random_data():
                                                                                 password='123'))
     print('[+] done')
 
+@app.cli.command()
+def backfill_timelines():
+    """ rebuilds the users' home timelines from the existing follows and answered questions """
+    print('[+] rebuilding home timelines...')
+    last_user_id = 0
+    while last_user_id is not None:
+        last_user_id = User.backfill_timelines(after_user_id=last_user_id,
+                                               users_limit=app.config['HOME_FEED_BACKFILL_BATCH_SIZE'])
+        app_database.session.commit()
+    print('[+] done')
+
+@app.cli.command()
+def perf_doctor():
+    """ explains the queries of the home, profile and api pages, run it against a seeded database """
+    viewer = User.query.order_by(User.followed_users_count.desc()).first()
+    owner = User.query.order_by(User.answered_questions_count.desc()).first()
+    if not viewer:
+        return print('[Error] the database has no users, run flask generate_random_data first')
+
+    with app.test_request_context():
+        web_pages = [url_for('main.home'), url_for('main.home_feed_page'), url_for('main.home_feed_new_questions'),
+                     url_for('main.user_profile', username=owner.username),
+                     url_for('main.user_answered_questions_page', username=owner.username),
+                     url_for('main.user_unanswered_questions_page', username=viewer.username),
+                     url_for('main.user_followers_page', username=owner.username),
+                     url_for('main.user_followed_users_page', username=owner.username)]
+        api_pages = []
+        for rule in app.url_map.iter_rules():
+            if app.view_functions[rule.endpoint].__module__ != 'app.api.user':
+                continue
+            #unanswered questions are only listed to their replier
+            username = viewer.username if 'unanswered' in rule.endpoint else owner.username
+            api_pages.append(url_for(rule.endpoint, **({'username': username} if 'username' in rule.arguments else {})))
+        web_headers = {'Cookie': '{}={}'.format(app.config.get('REMEMBER_COOKIE_NAME', COOKIE_NAME),
+                                                encode_cookie(str(viewer.id)))}
+        api_headers = {'Authorization': 'Bearer ' + viewer.api_create_auth_token()}
+
+    print('[+] requesting the pages as {viewer}, profiles of {owner}\n'.format(viewer=viewer.username,
+                                                                               owner=owner.username))
+    findings_count = 0
+    app_test_client = app.test_client(use_cookies=False)
+    for uri, headers in [(uri, web_headers) for uri in web_pages] + [(uri, api_headers) for uri in api_pages]:
+        with capture_statements(app_database.engine) as statements:
+            response = app_test_client.get(uri, headers=headers)
+            #streamed pages run their queries while they are read, and keep their request context until closed
+            response.get_data()
+            response.close()
+        with app_database.engine.connect() as connection:
+            findings = diagnose_statements(connection, statements)
+        print('GET {uri} -> {status}, {count} statements'.format(uri=uri, status=response.status_code,
+                                                                count=len(statements)))
+        for kind, detail, statement in findings:
+            print('    [{kind}] {detail}\n        {statement}'.format(kind=kind, detail=detail,
+                                                                     statement=' '.join(statement.split())[:300]))
+        findings_count += len(findings)
+    print('\n[+] done, {} findings'.format(findings_count))
+
 @app.shell_context_processor
 def create_shell_context():
     return dict(app=app, db=app_database, User=User, Role=Role, Question=Question, Answer=Answer,
-                AppPermissions=AppPermissions, Follow=Follow)
\ No newline at end of file
+                AppPermissions=AppPermissions, Follow=Follow, TimelineEntry=TimelineEntry)
\ No newline at end of file
@@ -328,6 +328,7 @@ class TestAPI(unittest.TestCase):
                     self.assertIsNotNone(response_data.get('followers')[0].get('following'))
                     self.assertIsNotNone(response_data.get('followers')[0].get('account_confirmed'))
                     self.assertIsNotNone(response_data.get('followers')[0].get('role'))
+                    self.assertTrue(response_data.get('followers')[0].get('follows_you'))
                     response = app_test_client.get(response_data.get('next'), headers=request_headers)
                     response_data = response.get_json(silent=True, cache=False)
                     self.assertIsNotNone(response_data)
@@ -462,6 +463,71 @@ class TestAPI(unittest.TestCase):
                     response_data = response.get_json(silent=True, cache=False)
                     self.assertIsNotNone(response_data)
     
+    def test_api_get_home_feed(self):
+        fake = Faker()
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser, followed = User.query.get(1), User.query.get(2)
+        testuser.follow(followed)
+        app_database.session.commit()
+        User.generate_fake_questions(followed.username, count=3)
+        User.generate_fake_answers(followed.username, count=3)
+        testuser.api_generate_auth_token()
+        request_headers = self.api_request_headers_bearer_auth(testuser.api_auth_token)
+
+        with self.app.test_request_context():
+            with self.app.test_client(use_cookies=False) as app_test_client:
+                response = app_test_client.get(url_for('api.api_get_home_feed'),
+                    headers=self.api_request_headers_bearer_auth(testuser.api_auth_token + str(fake.random_int())))
+                self.assertEqual(response.status_code, Unauthorized.code)
+
+                response = app_test_client.get(url_for('api.api_get_home_feed'), headers=request_headers)
+                response_data = response.get_json(silent=True, cache=False)
+                self.assertIsNotNone(response_data)
+                self.assertEqual(response_data.get('status_code'), 200)
+                self.assertEqual(len(response_data.get('questions')), followed.in_questions.filter_by(has_answer=True).count())
+                self.assertEqual(response_data.get('next'), 'NULL')
+                for question in response_data.get('questions'):
+                    self.assertEqual(question.get('replier'), followed.username)
+                    self.assertTrue(question.get('has_answer'))
+
+                response = app_test_client.get(url_for('api.api_get_home_feed', n=1), headers=request_headers)
+                response_data = response.get_json(silent=True, cache=False)
+                questions_count = 0
+                while response_data.get('next') != 'NULL':
+                    questions_count += len(response_data.get('questions'))
+                    response = app_test_client.get(response_data.get('next'), headers=request_headers)
+                    response_data = response.get_json(silent=True, cache=False)
+                questions_count += len(response_data.get('questions'))
+                self.assertEqual(questions_count, followed.in_questions.filter_by(has_answer=True).count())
+
+    def test_api_get_new_home_feed_questions(self):
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser, followed = User.query.get(1), User.query.get(2)
+        testuser.follow(followed)
+        app_database.session.commit()
+        User.generate_fake_questions(followed.username, count=3)
+        for i, question in enumerate(followed.in_questions.all()):
+            followed.answer_question(answer_content='answer{}'.format(i), question=question)
+        app_database.session.commit()
+        testuser.api_generate_auth_token()
+        request_headers = self.api_request_headers_bearer_auth(testuser.api_auth_token)
+
+        with self.app.test_request_context():
+            with self.app.test_client(use_cookies=False) as app_test_client:
+                response = app_test_client.get(url_for('api.api_get_new_home_feed_questions'), headers=request_headers)
+                response_data = response.get_json(silent=True, cache=False)
+                self.assertEqual(response_data.get('status_code'), 200)
+                self.assertEqual(response_data.get('count'), 3)
+                self.assertEqual(len(response_data.get('questions')), 3)
+
+                #the questions of a poll are marked seen, the next poll returns nothing
+                response = app_test_client.get(url_for('api.api_get_new_home_feed_questions'), headers=request_headers)
+                response_data = response.get_json(silent=True, cache=False)
+                self.assertEqual(response_data.get('count'), 0)
+                self.assertEqual(response_data.get('questions'), [])
+
     def test_api_get_user_unanswered_questions(self):
         '''
         test 3 cases:
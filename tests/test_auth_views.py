@@ -1,8 +1,11 @@
 import unittest, time, os, hashlib
+from unittest import mock
 from itsdangerous import TimedJSONWebSignatureSerializer
+from kombu.exceptions import OperationalError
 from flask import url_for
 from app import create_app, app_database
 from app.models import User, Role
+from app.tasks import prewarm_home_feed
 from confg import app_config, TokenExpirationTime
 
 
@@ -51,6 +54,22 @@ class TestAuthViews(unittest.TestCase):
                     'username' : 'testuser', 'password' : '123'}, follow_redirects=True)
                 self.assertTrue('testing-home-AMA' in response.get_data(as_text=True))
 
+    def test_signin_with_broker_down(self):
+        """ the home feed prewarm is best effort, users sign in when the message broker is down """
+        testuser = User(username='testuser', account_confirmed=True)
+        testuser.password = '123'
+        app_database.session.add(testuser)
+        app_database.session.commit()
+        self.app.config['HOME_FEED_PREWARM_ON_SIGNIN'] = True
+        with mock.patch.object(prewarm_home_feed, 'delay', side_effect=OperationalError('broker down')) as delay:
+            with self.app.test_request_context():
+                with self.app.test_client() as app_test_client:
+                    response = app_test_client.post(url_for('auth.signin'), data={
+                        'username' : 'testuser', 'password' : '123'}, follow_redirects=True)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue('testing-home-AMA' in response.get_data(as_text=True))
+        delay.assert_called_once_with(testuser.id)
+
     def test_signout(self):
         """ user sign out and gets redirected to sign in page """
         testuser = User(username='testuser')
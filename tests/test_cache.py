@@ -0,0 +1,141 @@
+import unittest, threading, time
+from app import create_app, app_database
+from app.cache import TTLCache, get_app_cache
+from app.models import User
+from app.main.views import render_answered_question_card
+from app.query_plans import capture_statements
+from confg import app_config
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiration_and_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=0.5)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        #'b' is the least recently used entry
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        time.sleep(0.6)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('c'))
+
+    def test_single_flight_build(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        builds_count = []
+        results = []
+
+        def build():
+            builds_count.append(1)
+            time.sleep(0.3)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_build('key', build)))
+                   for i in range(0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds_count), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+    def test_invalidation_during_build(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+
+        def build():
+            cache.invalidate('key')
+            return 'outdated'
+
+        self.assertEqual(cache.get_or_build('key', build), 'outdated')
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get_or_build('key', lambda: 'value'), 'value')
+        self.assertEqual(cache.get('key'), 'value')
+
+class TestHomeFeedCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(app_config['testing'])
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        app_database.create_all()
+
+    def tearDown(self):
+        app_database.session.remove()
+        app_database.drop_all()
+        self.app_ctx.pop()
+
+    def test_home_feed_cache_invalidation(self):
+        u1, u2, u3 = User(username='testuser1'), User(username='testuser2'), User(username='testuser3')
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+        u3.ask_question(question_content='question1?', question_recipient=u2)
+        u3.ask_question(question_content='question2?', question_recipient=u2)
+        app_database.session.commit()
+        u2.answer_question(answer_content='answer', question=u2.in_questions.first())
+        app_database.session.commit()
+
+        self.assertEqual(u1.get_home_feed_page()[0], [])
+        self.assertIsNotNone(get_app_cache('home_feed').get(u1.id))
+
+        #the viewer follows a user
+        u1.follow(u2)
+        self.assertIsNotNone(get_app_cache('home_feed').get(u1.id))
+        app_database.session.commit()
+        self.assertIsNone(get_app_cache('home_feed').get(u1.id))
+        self.assertEqual(len(u1.get_home_feed_page()[0]), 1)
+
+        #a followed user answers
+        u2.answer_question(answer_content='answer', question=u2.in_questions.offset(1).first())
+        app_database.session.commit()
+        self.assertEqual(len(u1.get_home_feed_page()[0]), 2)
+
+        #the viewer unfollows a user
+        u1.unfollow(u2)
+        app_database.session.rollback()
+        self.assertIsNotNone(get_app_cache('home_feed').get(u1.id))
+        u1.unfollow(u2)
+        app_database.session.commit()
+        self.assertEqual(u1.get_home_feed_page()[0], [])
+
+    def test_question_card_cache(self):
+        u1, u2 = User(username='testuser1', email='test1@mail.com'), User(username='testuser2', email='test2@mail.com')
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+        u1.ask_question(question_content='question?', question_recipient=u2)
+        app_database.session.commit()
+        question = u2.in_questions.first()
+        u2.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+
+        with self.app.test_request_context():
+            card = render_answered_question_card(question)
+            self.assertIs(render_answered_question_card(question), card)
+            self.assertTrue('testuser2' in card)
+            self.assertFalse('testuser2' in render_answered_question_card(question, with_replier=False))
+
+            #cards follow the asker's and replier's name changes
+            u1.username = 'testuser3'
+            app_database.session.commit()
+            self.assertTrue('testuser3' in render_answered_question_card(question))
+
+    def test_user_snapshot_cache(self):
+        user = User(username='testuser1', email='test1@mail.com')
+        app_database.session.add(user)
+        app_database.session.commit()
+        user_id = user.id
+        app_database.session.remove()
+
+        self.assertEqual(User.load_user_snapshot(user_id).username, 'testuser1')
+        app_database.session.remove()
+        with capture_statements(app_database.engine) as statements:
+            user = User.load_user_snapshot(user_id)
+            self.assertEqual(user.username, 'testuser1')
+        self.assertEqual(statements, [])
+
+        #writing the columns of the snapshot drops it once committed
+        user.username = 'testuser2'
+        app_database.session.commit()
+        app_database.session.remove()
+        self.assertEqual(User.load_user_snapshot(user_id).username, 'testuser2')
+        self.assertIsNone(User.load_user_snapshot(user_id + 1))
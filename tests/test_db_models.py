@@ -1,8 +1,15 @@
-import unittest, time
+import unittest, time, os, tempfile, datetime, json, zlib
 from itsdangerous import TimedJSONWebSignatureSerializer, BadSignature
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
 from faker import Faker
+from flask import url_for, _request_ctx_stack
 from app import create_app, app_database
-from app.models import User, Role, Question, Answer, Follow
+from app.models import User, Role, Question, Answer, Follow, TimelineEntry, ArchivedQuestion, AppPermissions
+from app.tasks import prewarm_home_feed, reconcile_user_counters, trim_timelines, archive_answered_questions
+from app.query_plans import capture_statements, explain_statement, get_full_scans, get_sorts, diagnose_statements
+from app.replicas import RoutingSession, reads_from_replica, read_only
+from app.cache import get_app_cache
 from confg import app_config, TokenExpirationTime
 
 class TestRoleModel(unittest.TestCase):
@@ -99,6 +106,206 @@ class TestFollowModel(unittest.TestCase):
 
         self.assertIsNone(Follow.query.get(1))
 
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(app_config['testing'])
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        app_database.create_all()
+
+    def tearDown(self):
+        app_database.session.remove()
+        app_database.drop_all()
+        self.app_ctx.pop()
+
+    def assertUsesIndexes(self, load, in_index_order=False):
+        """
+        every statement emitted by load() reads questions, answers and follows through an index,
+        and (in_index_order) reads the rows in the order of the index instead of sorting them
+        """
+        connection = app_database.session.connection()
+        if connection.dialect.name == 'postgresql':
+            #tables of the tests are small enough for postgres to always prefer sequential scans
+            connection.execute('SET enable_seqscan = off')
+        with capture_statements(app_database.engine) as statements:
+            load()
+        self.assertTrue(statements)
+        for statement, parameters in statements:
+            plan = explain_statement(connection, statement, parameters)
+            self.assertEqual(get_full_scans(plan), [], statement)
+            if in_index_order:
+                self.assertEqual(get_sorts(plan), [], statement)
+
+    def test_hot_queries_use_indexes(self):
+        u1, u2, u3 = [User(username='testuser{}'.format(i)) for i in range(1, 4)]
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+        u1.follow(u2)
+        u3.follow(u1)
+        u2.ask_question(question_content='question1?', question_recipient=u1)
+        u2.ask_question(question_content='question2?', question_recipient=u1)
+        app_database.session.commit()
+        u1.answer_question(answer_content='answer', question=u1.in_questions.first())
+        app_database.session.commit()
+        question_id = u1.in_questions.first().id
+        app_database.session.expire_all()
+
+        self.assertUsesIndexes(lambda: u1.get_answered_questions_page(page=1, questions_per_page=10))
+        self.assertUsesIndexes(lambda: u1.get_unanswered_questions_page(page=1, questions_per_page=10))
+        self.assertUsesIndexes(lambda: u1.get_answered_questions(questions_limit=10))
+        self.assertUsesIndexes(lambda: u1.is_following(u2))
+        self.assertUsesIndexes(lambda: u1.is_followed_by(u3))
+        self.assertUsesIndexes(lambda: u1.get_follow_states([u2.id, u3.id]))
+        self.assertUsesIndexes(lambda: u1.get_followers_page(page=1, users_per_page=10), in_index_order=True)
+        self.assertUsesIndexes(lambda: u1.get_followed_users_page(page=1, users_per_page=10), in_index_order=True)
+        self.assertUsesIndexes(lambda: Answer.query.filter(Answer.question_id == question_id).first())
+
+    def test_timeline_queries_use_indexes(self):
+        u1, u2, u3 = [User(username='testuser{}'.format(i)) for i in range(1, 4)]
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+        u1.follow(u2)
+        for i in range(0, 3):
+            u3.ask_question(question_content='question{}?'.format(i), question_recipient=u2)
+        app_database.session.commit()
+        for question in u2.in_questions.all():
+            u2.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+        next_cursor = u1.get_timeline_page_ids(questions_per_page=1)[1]
+        u1.mark_feed_seen(u1.get_new_timeline_questions(questions_limit=1)[2])
+        app_database.session.commit()
+        app_database.session.expire_all()
+
+        self.assertUsesIndexes(lambda: u1.get_timeline_page_ids(questions_per_page=1), in_index_order=True)
+        self.assertUsesIndexes(lambda: u1.get_timeline_page_ids(cursor=next_cursor, questions_per_page=1),
+                               in_index_order=True)
+        self.assertUsesIndexes(lambda: u1.get_new_timeline_questions(questions_limit=1), in_index_order=True)
+        self.assertUsesIndexes(lambda: u1.get_feed_marker(), in_index_order=True)
+
+    def test_diagnose_statements(self):
+        app_database.session.add(User(username='testuser1', about_me='about me'))
+        app_database.session.commit()
+
+        with capture_statements(app_database.engine) as statements:
+            User.query.filter(User.about_me == 'about me').all()
+            User.query.filter(User.username == 'testuser1').first()
+            User.query.filter(User.username == 'testuser1').first()
+        findings = diagnose_statements(app_database.session.connection(), statements)
+        self.assertEqual(sorted(kind for kind, detail, statement in findings), ['full scan', 'repeated'])
+
+class TestReadReplicas(unittest.TestCase):
+    def setUp(self):
+        replica_fd, self.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(replica_fd)
+        self.app = create_app(type('AppReplicaTestingConfig', (app_config['testing'],),
+                                   {'SQLALCHEMY_REPLICA_URIS': ['sqlite:///' + self.replica_path]}))
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        app_database.create_all()
+        self.replica_engine = app_database.get_engine(self.app, bind='ama_replica_0')
+        app_database.Model.metadata.create_all(bind=self.replica_engine)
+
+    def tearDown(self):
+        app_database.session.remove()
+        app_database.drop_all()
+        self.replica_engine.dispose()
+        os.remove(self.replica_path)
+        self.app_ctx.pop()
+
+    def test_reads_from_replica(self):
+        app_database.session.add(User(username='testuser1', about_me='primary'))
+        app_database.session.commit()
+        self.replica_engine.execute(User.__table__.insert(), username='testuser1', about_me='replica')
+        app_database.session.remove()
+
+        @reads_from_replica
+        def read_about_me():
+            return User.load_user_by_username('testuser1').about_me
+
+        with self.app.test_request_context():
+            self.assertEqual(read_about_me(), 'replica')
+            self.assertEqual(User.query.count(), 1)
+            #writes and the reads following them go to the primary
+            app_database.session.add(User(username='testuser2'))
+            self.assertEqual(User.query.count(), 2)
+            app_database.session.rollback()
+            app_database.session.expire_all()
+            self.assertEqual(read_about_me(), 'primary')
+        app_database.session.remove()
+        with self.app.test_request_context():
+            self.assertEqual(User.load_user_by_username('testuser1').about_me, 'primary')
+
+    def test_read_only_view(self):
+        app_database.session.add(User(username='testuser1'))
+        app_database.session.commit()
+
+        @read_only
+        def rename_user():
+            User.load_user_by_username('testuser1').username = 'testuser2'
+            return User.load_user_by_username('testuser2')
+
+        with self.app.test_request_context():
+            #the changes of read only views are never flushed
+            self.assertIsNone(rename_user())
+        app_database.session.remove()
+        self.assertIsNotNone(User.load_user_by_username('testuser1'))
+
+    def test_new_home_feed_questions_poll_reads_from_primary(self):
+        user = User(username='testuser1', email='testuser1@ama.com', account_confirmed=True)
+        app_database.session.add(user)
+        app_database.session.commit()
+        user.api_generate_auth_token()
+        request_headers = {'Authorization': 'Bearer ' + user.api_auth_token}
+        app_database.session.remove()
+
+        #the poll moves the seen marker from what it reads, a lagging replica would move it backwards
+        with self.app.test_request_context():
+            with self.app.test_client(use_cookies=False) as app_test_client:
+                with capture_statements(self.replica_engine) as replica_statements:
+                    response = app_test_client.get(url_for('api.api_get_new_home_feed_questions'),
+                                                   headers=request_headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(replica_statements, [])
+
+    def test_home_reads_from_replica(self):
+        user = User(username='testuser1', email='testuser1@ama.com', account_confirmed=True)
+        user.password = '123'
+        app_database.session.add(user)
+        app_database.session.commit()
+        self.replica_engine.execute(User.__table__.insert(), id=user.id, username=user.username, email=user.email,
+                                    account_confirmed=True, password_hash=user.password_hash)
+        self.app.config['DATABASE_REPLICA_LAG_SECONDS'] = 0
+
+        with self.app.test_request_context():
+            with self.app.test_client() as app_test_client:
+                app_test_client.post(url_for('auth.signin'), data={'username': 'testuser1', 'password': '123'})
+                with app_test_client.session_transaction() as session:
+                    primary_reads_until = session['ama_primary_reads_until']
+                time.sleep(0.01)
+                #the requests of the tests share the session, a new request starts with a new one
+                app_database.session.remove()
+                #the user loader queries the user before the view runs
+                get_app_cache('auth_user').clear()
+
+                read_only_transactions = []
+                def record_read_only_transaction(session, transaction, connection):
+                    read_only_transactions.append(_request_ctx_stack.top.__dict__.get('ama_read_only'))
+                event.listen(RoutingSession, 'after_begin', record_read_only_transaction)
+                try:
+                    with capture_statements(app_database.engine) as primary_statements, \
+                         capture_statements(self.replica_engine) as replica_statements:
+                        response = app_test_client.get(url_for('main.home'))
+                        self.assertTrue('testing-home-AMA' in response.get_data(as_text=True))
+                finally:
+                    event.remove(RoutingSession, 'after_begin', record_read_only_transaction)
+                self.assertEqual(primary_statements, [])
+                self.assertTrue(replica_statements)
+                self.assertTrue(read_only_transactions)
+                self.assertTrue(all(read_only_transactions))
+                #the home page does not write so its users are not pinned to the primary
+                with app_test_client.session_transaction() as session:
+                    self.assertEqual(session['ama_primary_reads_until'], primary_reads_until)
+
 class TestUserModel(unittest.TestCase):
     def setUp(self):
         self.app = create_app(app_config['testing'])
@@ -166,6 +373,29 @@ class TestUserModel(unittest.TestCase):
         self.assertTrue(admin.has_permissions(Role.roles['admin']))
         self.assertTrue(admin.is_admin())
 
+    def test_roles_map(self):
+        Role.populate_table()
+        user_role = Role.query.filter(Role.role_name == 'user').first()
+        user = User(username='testuser1', role=user_role)
+        app_database.session.add(user)
+        app_database.session.commit()
+
+        user.role_id
+        Role.load_roles_map()
+        with capture_statements(app_database.engine) as statements:
+            self.assertTrue(user.has_permissions(AppPermissions.FOLLOW_OTHERS))
+            self.assertEqual(user.role_name, 'user')
+        self.assertEqual(statements, [])
+
+        #writing roles drops the map, it is reloaded by the next permission check
+        user_role.permissions &= ~AppPermissions.FOLLOW_OTHERS
+        app_database.session.flush()
+        self.assertFalse(user.has_permissions(AppPermissions.FOLLOW_OTHERS))
+        app_database.session.rollback()
+        self.assertTrue(user.has_permissions(AppPermissions.FOLLOW_OTHERS))
+        Role.populate_table()
+        self.assertTrue(user.has_permissions(Role.roles['user']))
+
     def test_is_question_replier_asker(self):
         fake = Faker()
         q_content = fake.sentence(nb_words=6)
@@ -251,11 +481,11 @@ class TestUserModel(unittest.TestCase):
         app_database.session.add(follow1)
         app_database.session.commit()
 
-        followers_list = user2.get_followers_list()
+        followers_list, has_next = user2.get_followers_page(page=1, users_per_page=10)
         self.assertEqual(len(followers_list), 1)
         self.assertEqual(followers_list[0].username, user1.username)
 
-        followed_list = user1.get_followed_users_list()
+        followed_list, has_next = user1.get_followed_users_page(page=1, users_per_page=10)
         self.assertEqual(len(followed_list), 1)
         self.assertEqual(followed_list[0].username, user2.username)
 
@@ -277,6 +507,205 @@ class TestUserModel(unittest.TestCase):
         self.assertFalse(user2.is_followed_by(user2))
         self.assertFalse(user1.is_following(user1))
 
+    def test_follow_accessors_request_memo(self):
+        fake = Faker()
+        user1 = User(username=fake.user_name())
+        user2 = User(username=fake.user_name())
+        app_database.session.add_all([user1, user2])
+        app_database.session.commit()
+
+        with self.app.test_request_context():
+            self.assertFalse(user1.is_following(user2))
+            with capture_statements(app_database.engine) as statements:
+                self.assertFalse(user1.is_following(user2))
+            self.assertEqual(statements, [])
+            self.assertFalse(user2.is_followed_by(user1))
+
+            user1.follow(user2)
+            app_database.session.commit()
+            self.assertTrue(user1.is_following(user2))
+            self.assertTrue(user2.is_followed_by(user1))
+
+            user1.unfollow(user2)
+            app_database.session.commit()
+            self.assertFalse(user1.is_following(user2))
+            self.assertFalse(user2.is_followed_by(user1))
+
+        #a new request starts with an empty memo
+        app_database.session.add(Follow(follower=user1, followed=user2))
+        app_database.session.commit()
+        with self.app.test_request_context():
+            self.assertTrue(user1.is_following(user2))
+
+    def test_user_counters(self):
+        u1, u2, u3 = [User(username='testuser{}'.format(i)) for i in range(1, 4)]
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+
+        u1.follow(u2)
+        u3.follow(u2)
+        u2.ask_question(question_content='question1?', question_recipient=u1)
+        u2.ask_question(question_content='question2?', question_recipient=u1)
+        app_database.session.commit()
+        u1.answer_question(answer_content='answer', question=u1.in_questions.first())
+        u3.unfollow(u2)
+        app_database.session.commit()
+        self.assertEqual((u1.followers_count, u1.followed_users_count), (0, 1))
+        self.assertEqual((u2.followers_count, u2.followed_users_count), (1, 0))
+        self.assertEqual((u1.answered_questions_count, u1.unanswered_questions_count), (1, 1))
+
+        #rows written without the model methods make the counters drift
+        app_database.session.add(Follow(follower=u3, followed=u1))
+        app_database.session.add(Question(question_content='question3?', asker=u3, replier=u2))
+        app_database.session.commit()
+        self.app.config['USER_COUNTERS_RECONCILIATION_BATCH_SIZE'] = 2
+        reconcile_user_counters()
+        self.assertEqual((u1.followers_count, u3.followed_users_count, u2.unanswered_questions_count), (1, 1, 1))
+        self.assertEqual(User.reconcile_counters(after_user_id=u3.id), None)
+
+    def test_archive_answered_questions(self):
+        u1 = User(username='testuser1', email='testuser1@ama.com')
+        u2 = User(username='testuser2', email='testuser2@ama.com')
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+        u2.follow(u1)
+        for i in range(5):
+            u2.ask_question(question_content='question{}?'.format(i), question_recipient=u1)
+        u2.ask_question(question_content='unanswered?', question_recipient=u1)
+        app_database.session.commit()
+        questions = u1.in_questions.order_by(Question.id).all()
+        for i, question in enumerate(questions[:5]):
+            u1.answer_question(answer_content='answer{}.'.format(i), question=question)
+            #the first three questions are old enough to be archived
+            question.timestamp = datetime.datetime.utcnow() - datetime.timedelta(days=(400 - i) if i < 3 else i)
+        app_database.session.commit()
+        oldest_question_id = questions[0].id
+
+        self.app.config['QUESTIONS_ARCHIVE_BATCH_SIZE'] = 2
+        archive_answered_questions()
+        self.assertEqual(Question.query.count(), 3)
+        self.assertEqual(Answer.query.count(), 2)
+        self.assertEqual(ArchivedQuestion.query.count(), 3)
+        self.assertEqual(TimelineEntry.query.filter(TimelineEntry.owner_id == u2.id).count(), 2)
+
+        #the pages of the answered questions continue into the archive
+        pages = [u1.get_answered_questions_page(page, 2) for page in range(1, 4)]
+        self.assertEqual([[card.question_content for card in cards] for cards, has_next in pages],
+                         [['question3?', 'question4?'], ['question2?', 'question1?'], ['question0?']])
+        self.assertEqual([has_next for cards, has_next in pages], [True, True, False])
+        archived_card = pages[2][0][0]
+        self.assertEqual((archived_card.id, archived_card.answer.answer_content), (oldest_question_id, 'answer0.'))
+        self.assertEqual((archived_card.asker.username, archived_card.replier.username), ('testuser2', 'testuser1'))
+        self.assertTrue(archived_card.has_answer)
+
+        #archived questions are counted as answered questions
+        reconcile_user_counters()
+        self.assertEqual((u1.answered_questions_count, u1.unanswered_questions_count), (5, 1))
+
+    def test_archived_question_content(self):
+        long_content = 'what do you think about the weather today? ' * 10
+        short_packed = ArchivedQuestion.pack_content('question?', 'answer.')
+        long_packed = ArchivedQuestion.pack_content(long_content, 'answer.')
+        #short contents are stored as they are, long ones compressed
+        self.assertEqual(short_packed, b'j["question?","answer."]')
+        self.assertTrue(long_packed.startswith(b'z'))
+        self.assertLess(len(long_packed), len(long_content))
+        self.assertEqual(ArchivedQuestion.unpack_content(short_packed),
+                         {'question_content': 'question?', 'answer_content': 'answer.'})
+        self.assertEqual(ArchivedQuestion.unpack_content(long_packed),
+                         {'question_content': long_content, 'answer_content': 'answer.'})
+        #contents archived before are whole zlib streams
+        legacy_content = {'question_content': 'question?', 'answer_content': 'answer.'}
+        legacy_packed = zlib.compress(json.dumps(legacy_content).encode('utf-8'))
+        self.assertEqual(ArchivedQuestion.unpack_content(legacy_packed), legacy_content)
+
+    def test_get_follow_states(self):
+        u1, u2, u3, u4 = [User(username='testuser{}'.format(i)) for i in range(1, 5)]
+        app_database.session.add_all([u1, u2, u3, u4])
+        app_database.session.commit()
+        u1.follow(u2)
+        u1.follow(u3)
+        u3.follow(u1)
+        u4.follow(u1)
+        app_database.session.commit()
+
+        following_ids, followers_ids = u1.get_follow_states(user.id for user in (u2, u3, u4))
+        self.assertEqual(following_ids, {u2.id, u3.id})
+        self.assertEqual(followers_ids, {u3.id, u4.id})
+        self.assertEqual(u1.get_follow_states([]), (set(), set()))
+
+    def test_read_only_records(self):
+        Role.populate_table()
+        user_role = Role.query.filter(Role.role_name == 'user').first()
+        u1 = User(username='testuser1', email='testuser1@ama.com', role=user_role)
+        u2 = User(username='testuser2', email='testuser2@ama.com', role=user_role)
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+        u1.follow(u2)
+        u1.ask_question(question_content='answered question', question_recipient=u2)
+        u1.ask_question(question_content='unanswered question', question_recipient=u2)
+        app_database.session.commit()
+        answered_question = Question.query.filter_by(question_content='answered question').first()
+        u2.answer_question(answer_content='answer', question=answered_question)
+        app_database.session.commit()
+
+        followers, has_next = u2.get_followers_page(page=1, users_per_page=10)
+        self.assertFalse(has_next)
+        self.assertEqual([follower.username for follower in followers], ['testuser1'])
+        self.assertFalse(hasattr(followers[0], '__dict__'))
+        self.assertEqual(followers[0].generate_gravatar_uri(), u1.generate_gravatar_uri())
+        self.assertEqual(followers[0].role_name, 'user')
+        self.assertEqual(followers[0].followed_users_count, 1)
+
+        cards, has_next = u2.get_answered_questions_page(page=1, questions_per_page=10)
+        self.assertFalse(has_next)
+        self.assertEqual(len(cards), 1)
+        self.assertFalse(hasattr(cards[0], '__dict__'))
+        self.assertEqual(cards[0].asker.username, 'testuser1')
+        self.assertEqual(cards[0].replier.username, 'testuser2')
+        self.assertEqual(cards[0].answer.answer_content, 'answer')
+        self.assertEqual(User.api_get_question_info(cards[0]),
+                         User.api_get_question_info(answered_question))
+        cards, has_next = u2.get_unanswered_questions_page(page=1, questions_per_page=10)
+        self.assertEqual([card.question_content for card in cards], ['unanswered question'])
+        self.assertIsNone(cards[0].answer)
+
+    def test_loading_profiles(self):
+        Role.populate_table()
+        user_role = Role.query.filter(Role.role_name == 'user').first()
+        u1 = User(username='testuser1', email='testuser1@ama.com', role=user_role)
+        u2 = User(username='testuser2', email='testuser2@ama.com', role=user_role)
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+        u1.ask_question(question_content='question?', question_recipient=u2)
+        app_database.session.commit()
+        u2.answer_question(answer_content='answer', question=u2.in_questions.first())
+        app_database.session.commit()
+        app_database.session.expire_all()
+
+        #relationships left out of the profile raise in the tests instead of lazy loading
+        user = User.load_user_by_username('testuser1', profile='ref')
+        with self.assertRaises(InvalidRequestError):
+            user.role
+        app_database.session.expire_all()
+        Role.load_roles_map()
+        with capture_statements(app_database.engine) as statements:
+            user = User.load_user_by_username('testuser1', profile='auth')
+            self.assertEqual(user.role_name, 'user')
+            self.assertFalse(user.is_admin())
+        self.assertEqual(len(statements), 1)
+
+        app_database.session.expire_all()
+        u2.id
+        with capture_statements(app_database.engine) as statements:
+            question = u2.get_answered_questions(profile='answer')[0]
+            self.assertEqual(question.answer.answer_content, 'answer')
+        self.assertEqual(len(statements), 1)
+        with self.assertRaises(InvalidRequestError):
+            question.asker
+        with self.assertRaises(InvalidRequestError):
+            question.answer.question
+
     def test_follow_unfollow(self):
         fake = Faker()
         user1 = User(username=fake.user_name())
@@ -305,6 +734,312 @@ class TestUserModel(unittest.TestCase):
         self.assertIsNone(user1.follows.first())
         self.assertIsNone(user2.followed_by.first())
 
+    def test_timeline_fan_out(self):
+        u1, u2, u3 = User(username='testuser1'), User(username='testuser2'), User(username='testuser3')
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+
+        u1.follow(u2)
+        app_database.session.commit()
+
+        u3.ask_question(question_content='question1?', question_recipient=u2)
+        u3.ask_question(question_content='question2?', question_recipient=u1)
+        app_database.session.commit()
+
+        u2.answer_question(answer_content='answer1', question=u2.in_questions.first())
+        u1.answer_question(answer_content='answer2', question=u1.in_questions.first())
+        app_database.session.commit()
+
+        #only followers of the replier receive the answered question
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question1?'])
+        self.assertEqual(u3.get_timeline_page()[0], [])
+
+        #following seeds the timeline with the followed user's recent answers
+        u3.follow(u1)
+        app_database.session.commit()
+        self.assertEqual([q.question_content for q in u3.get_timeline_page()[0]], ['question2?'])
+
+        u1.unfollow(u2)
+        app_database.session.commit()
+        self.assertEqual(u1.get_timeline_page()[0], [])
+
+    def test_backfill_timelines(self):
+        u1, u2 = User(username='testuser1'), User(username='testuser2')
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+
+        for i in range(0, 7):
+            u1.ask_question(question_content='question{}?'.format(i), question_recipient=u2)
+        app_database.session.commit()
+        for question in u2.in_questions.all():
+            u2.answer_question(answer_content='answer', question=question)
+        app_database.session.add(Follow(follower=u1, followed=u2))
+        app_database.session.commit()
+
+        #follow rows inserted directly bypass the fan-out
+        self.assertEqual(u1.timeline.count(), 0)
+
+        self.assertEqual(User.backfill_timelines(users_limit=1), u1.id)
+        app_database.session.commit()
+        self.assertEqual(u1.timeline.count(), self.app.config['HOME_FEED_QUESTIONS_PER_FOLLOWED_USER'])
+        self.assertEqual(User.backfill_timelines(after_user_id=u1.id, users_limit=1), u2.id)
+        self.assertIsNone(User.backfill_timelines(after_user_id=u2.id, users_limit=1))
+        self.assertEqual(u2.timeline.count(), 0)
+
+    def test_trim_timelines(self):
+        u1, u2, u3 = [User(username='testuser{}'.format(i)) for i in range(1, 4)]
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+        u1.follow(u3)
+        u2.follow(u3)
+        for i in range(0, 5):
+            u1.ask_question(question_content='question{}?'.format(i), question_recipient=u3)
+        app_database.session.commit()
+        for question in u3.in_questions.order_by(Question.id).all():
+            u3.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+        newest_questions_ids = u1.get_timeline_page_ids(questions_per_page=3)[0]
+
+        self.app.config['HOME_FEED_TIMELINE_MAX_ENTRIES'] = 3
+        self.app.config['HOME_FEED_TIMELINE_TRIM_BATCH_SIZE'] = 2
+        trim_timelines()
+        self.assertEqual(u1.timeline.count(), 3)
+        self.assertEqual(u2.timeline.count(), 3)
+        self.assertEqual(u1.get_timeline_page_ids()[0], newest_questions_ids)
+
+    def test_timeline_pagination(self):
+        u1, u2 = User(username='testuser1'), User(username='testuser2')
+        app_database.session.add_all([u1, u2])
+        app_database.session.commit()
+
+        u1.follow(u2)
+        for i in range(0, 5):
+            u1.ask_question(question_content='question{}?'.format(i), question_recipient=u2)
+        app_database.session.commit()
+        for question in u2.in_questions.all():
+            u2.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+
+        pages = []
+        questions, next_cursor = u1.get_timeline_page(questions_per_page=2)
+        pages.append(questions)
+        while next_cursor:
+            questions, next_cursor = u1.get_timeline_page(cursor=next_cursor, questions_per_page=2)
+            pages.append(questions)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        questions_ids = [question.id for page in pages for question in page]
+        self.assertEqual(sorted(questions_ids, reverse=True), questions_ids)
+
+        with self.assertRaises(BadSignature):
+            u1.get_timeline_page(cursor='foo')
+
+    def test_timeline_ranking(self):
+        u1, u2, u3, u4 = [User(username='testuser{}'.format(i)) for i in range(1, 5)]
+        app_database.session.add_all([u1, u2, u3, u4])
+        app_database.session.commit()
+
+        u1.follow(u2)
+        u1.follow(u3)
+        u1.ask_question(question_content='question1?', question_recipient=u3)
+        u1.ask_question(question_content='question2?', question_recipient=u3)
+        u4.ask_question(question_content='question3?', question_recipient=u2)
+        app_database.session.commit()
+
+        u3.answer_question(answer_content='answer', question=u3.in_questions.first())
+        app_database.session.commit()
+        u2.answer_question(answer_content='answer', question=u2.in_questions.first())
+        app_database.session.commit()
+
+        #u1 asked u3 two questions so u3's older answer outranks u2's newer one
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question1?', 'question3?'])
+
+        #the entries ranked by the database on fan-out are ranked the same on rebuild
+        fanned_out_scores = sorted(entry.score for entry in u1.timeline)
+        u1.rebuild_timeline()
+        app_database.session.commit()
+        self.assertEqual(sorted(entry.score for entry in u1.timeline), fanned_out_scores)
+
+        #follows are aged in whole days
+        u1.follows.filter(Follow.followed_id == u2.id).one().timestamp = \
+                datetime.datetime.utcnow() - datetime.timedelta(days=3, hours=12)
+        app_database.session.commit()
+        self.assertEqual(TimelineEntry.load_ranking_bonuses(owner_id=u1.id, author_id=u2.id),
+                         {(u1.id, u2.id): 3 * self.app.config['HOME_FEED_RANK_FOLLOW_AGE_WEIGHT']})
+
+        self.app.config['HOME_FEED_RANK_AFFINITY_WEIGHT'] = 0
+        u1.rebuild_timeline()
+        app_database.session.commit()
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question3?', 'question1?'])
+
+        self.app.config['HOME_FEED_FANOUT_MAX_FOLLOWERS'] = 0
+        self.app.config['HOME_FEED_RANK_AFFINITY_WEIGHT'] = 3600
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question1?', 'question3?'])
+
+    def test_prewarm_home_feed(self):
+        u1, u2, u3, u4 = [User(username='testuser{}'.format(i)) for i in range(1, 5)]
+        app_database.session.add_all([u1, u2, u3, u4])
+        app_database.session.commit()
+        u1.ask_question(question_content='question1?', question_recipient=u3)
+        u4.ask_question(question_content='question2?', question_recipient=u2)
+        app_database.session.commit()
+        u3.answer_question(answer_content='answer', question=u3.in_questions.first())
+        app_database.session.commit()
+        u2.answer_question(answer_content='answer', question=u2.in_questions.first())
+        app_database.session.add_all([Follow(follower=u1, followed=u2), Follow(follower=u1, followed=u3)])
+        app_database.session.commit()
+
+        #users without a timeline get one built
+        prewarm_home_feed(u1.id)
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question1?', 'question2?'])
+
+        #the entries of the first pages are re-ranked with the current bonuses
+        self.app.config['HOME_FEED_RANK_AFFINITY_WEIGHT'] = 0
+        self.app.config['HOME_FEED_PREWARM_PAGES'] = 1
+        self.app.config['HOME_FEED_QUESTIONS_PER_PAGE'] = 1
+        scores = {entry.question_id: entry.score for entry in u1.timeline}
+        prewarm_home_feed(u1.id)
+        self.assertEqual(u1.timeline.count(), 2)
+        question1_id, question2_id = [Question.query.filter_by(question_content=question_content).one().id
+                                      for question_content in ('question1?', 'question2?')]
+        self.assertLess(u1.timeline.filter(TimelineEntry.question_id == question1_id).one().score,
+                        scores[question1_id])
+        self.assertEqual(u1.timeline.filter(TimelineEntry.question_id == question2_id).one().score,
+                         scores[question2_id])
+        self.app.config['HOME_FEED_QUESTIONS_PER_PAGE'] = 20
+        self.assertEqual([q.question_content for q in u1.get_timeline_page()[0]], ['question2?', 'question1?'])
+
+    def test_timeline_high_follower_accounts(self):
+        self.app.config['HOME_FEED_FANOUT_MAX_FOLLOWERS'] = 1
+        u1, u2, u3, u4 = [User(username='testuser{}'.format(i)) for i in range(1, 5)]
+        app_database.session.add_all([u1, u2, u3, u4])
+        app_database.session.commit()
+
+        #u2 has two followers so its answers are pulled, u3 has one so its answers are pushed
+        u1.follow(u2)
+        u4.follow(u2)
+        u1.follow(u3)
+        app_database.session.commit()
+        self.assertTrue(u2.is_high_follower_account())
+        self.assertFalse(u3.is_high_follower_account())
+        self.assertEqual(u1.get_high_follower_followed_users_ids(), {u2.id})
+
+        for replier in (u2, u3, u2, u3):
+            u4.ask_question(question_content='question?', question_recipient=replier)
+        app_database.session.commit()
+        for question in Question.query.order_by(Question.id).all():
+            question.replier.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+
+        self.assertEqual(TimelineEntry.query.filter(TimelineEntry.author_id == u2.id).count(), 0)
+        self.assertEqual(u1.timeline.count(), 2)
+
+        questions, next_cursor = u1.get_timeline_page(questions_per_page=3)
+        self.assertEqual(len(questions), 3)
+        questions += u1.get_timeline_page(cursor=next_cursor, questions_per_page=3)[0]
+        self.assertEqual(sorted(q.id for q in questions), [q.id for q in Question.query.order_by(Question.id)])
+
+        u1.rebuild_timeline()
+        app_database.session.commit()
+        self.assertEqual(TimelineEntry.query.filter(TimelineEntry.author_id == u2.id).count(), 0)
+
+    def test_new_timeline_questions(self):
+        u1, u2, u3, u4 = [User(username='testuser{}'.format(i)) for i in range(1, 5)]
+        app_database.session.add_all([u1, u2, u3, u4])
+        app_database.session.commit()
+        u1.follow(u2)
+        u1.follow(u3)
+        u4.follow(u3)
+        for replier in (u2, u3, u2, u3):
+            u4.ask_question(question_content='question?', question_recipient=replier)
+        app_database.session.commit()
+
+        u2.answer_question(answer_content='answer', question=u2.in_questions.first())
+        app_database.session.commit()
+
+        #the feed was never seen
+        questions, new_questions_count, newest_entry = u1.get_new_timeline_questions()
+        self.assertEqual(new_questions_count, 1)
+        self.assertEqual(newest_entry, u1.get_feed_marker())
+
+        u1.mark_feed_seen(newest_entry)
+        app_database.session.commit()
+        self.assertEqual(u1.get_new_timeline_questions(), ([], 0, None))
+
+        #u3's answers are pulled at read time
+        self.app.config['HOME_FEED_FANOUT_MAX_FOLLOWERS'] = 1
+        for replier in (u2, u3):
+            for question in replier.in_questions.filter(Question.has_answer.is_(False)).all():
+                replier.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+
+        questions, new_questions_count, newest_entry = u1.get_new_timeline_questions(questions_limit=2)
+        self.assertEqual(new_questions_count, 3)
+        self.assertEqual(len(questions), 2)
+        self.assertEqual(questions[0].replier_id, u3.id)
+
+    def test_new_timeline_questions_past_the_limit(self):
+        u1, u2, u3 = [User(username='testuser{}'.format(i)) for i in range(1, 4)]
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+        u1.follow(u2)
+        for i in range(0, 6):
+            u3.ask_question(question_content='question{}?'.format(i), question_recipient=u2)
+        app_database.session.commit()
+        u1.mark_feed_seen((datetime.datetime.utcnow(), 0))
+        app_database.session.commit()
+        #the answers share a timestamp, the question id breaks the tie
+        answered_at = datetime.datetime.utcnow()
+        for question in u2.in_questions.order_by(Question.id).all():
+            u2.answer_question(answer_content='answer', question=question)
+        TimelineEntry.query.filter(TimelineEntry.owner_id == u1.id).update({TimelineEntry.timestamp: answered_at})
+        app_database.session.commit()
+
+        #every new question is delivered once, oldest batches first, each batch newest first
+        delivered_questions = []
+        new_questions_counts = []
+        while True:
+            questions, new_questions_count, newest_entry = u1.get_new_timeline_questions(questions_limit=4)
+            if newest_entry is None:
+                break
+            self.assertEqual(newest_entry, (answered_at, questions[0].id))
+            delivered_questions += [q.question_content for q in reversed(questions)]
+            new_questions_counts.append(new_questions_count)
+            u1.mark_feed_seen(newest_entry)
+            app_database.session.commit()
+        self.assertEqual(delivered_questions, ['question{}?'.format(i) for i in range(0, 6)])
+        self.assertEqual(new_questions_counts, [6, 2])
+
+    def test_load_followed_users_answered_questions(self):
+        u1, u2, u3 = User(username='testuser1'), User(username='testuser2'), User(username='testuser3')
+        app_database.session.add_all([u1, u2, u3])
+        app_database.session.commit()
+
+        u1.follow(u2)
+        u1.follow(u3)
+        for replier in (u2, u3):
+            for i in range(0, 4):
+                u1.ask_question(question_content='question{}?'.format(i), question_recipient=replier)
+        app_database.session.commit()
+        for replier in (u2, u3):
+            for question in replier.in_questions.limit(3).all():
+                replier.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+
+        window_functions_supported = Question.window_functions_supported
+        for supported in (True, False):
+            Question.window_functions_supported = staticmethod(lambda: supported)
+            try:
+                questions = Question.load_followed_users_answered_questions(user=u1, questions_per_user=2)
+            finally:
+                Question.window_functions_supported = window_functions_supported
+            self.assertEqual(len(questions), 4)
+            self.assertTrue(all(q.has_answer for q in questions))
+            self.assertEqual(len([q for q in questions if q.replier_id == u2.id]), 2)
+            self.assertEqual(len([q for q in questions if q.replier_id == u3.id]), 2)
+
+        self.assertEqual(Question.load_followed_users_answered_questions(user=u2, questions_per_user=2), [])
+
     def test_api_generate_auth_token(self):
         fake = Faker()
         testuser = User(username=fake.user_name())
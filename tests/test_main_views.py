@@ -1,4 +1,4 @@
-import unittest, time
+import unittest, time, re, html
 from werkzeug.exceptions import Forbidden, NotFound
 from faker import Faker
 from itsdangerous import TimedJSONWebSignatureSerializer
@@ -40,6 +40,116 @@ class TestMainViews(unittest.TestCase):
                 response = app_test_client.get(url_for('main.home'))
                 self.assertTrue('testing-home-AMA' in response.get_data(as_text=True))
 
+    def test_home_feed_page(self):
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser1, testuser2 = User.query.get(1), User.query.get(2)
+        testuser1.password = '123'
+        testuser1.follow(testuser2)
+        app_database.session.commit()
+        User.generate_fake_questions(testuser2.username, count=5)
+        for question in testuser2.in_questions.all():
+            testuser2.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+        self.app.config['HOME_FEED_QUESTIONS_PER_PAGE'] = 2
+
+        with self.app.test_request_context():
+            with self.app.test_client() as app_test_client:
+                response = app_test_client.get(url_for('main.home_feed_page'), follow_redirects=True)
+                self.assertTrue('testing-signin-AMA' in response.get_data(as_text=True))
+
+                app_test_client.post(url_for('auth.signin'), data={'username': testuser1.username,
+                                                                   'password': '123'})
+
+                response = app_test_client.get(url_for('main.home'))
+                self.assertTrue('home-feed-next' in response.get_data(as_text=True))
+
+                pages_count = 0
+                next_page_uri = url_for('main.home_feed_page')
+                while next_page_uri:
+                    response_data = app_test_client.get(next_page_uri).get_json()
+                    self.assertTrue('Q: ' in response_data.get('html'))
+                    next_page_uri = response_data.get('next')
+                    pages_count += 1
+                self.assertEqual(pages_count, 3)
+
+                response = app_test_client.get(url_for('main.home_feed_page', c='foo'))
+                self.assertEqual(response.status_code, NotFound.code)
+
+    def test_home_streaming(self):
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser1, testuser2 = User.query.get(1), User.query.get(2)
+        testuser1.password = '123'
+        testuser1.follow(testuser2)
+        app_database.session.commit()
+        User.generate_fake_questions(testuser2.username, count=2)
+        for question in testuser2.in_questions.all():
+            testuser2.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+        self.app.config['STREAM_HTML_PAGES'] = True
+
+        #the client must not preserve the request contexts, the streamed response pops its own
+        with self.app.test_request_context():
+            app_test_client = self.app.test_client()
+            app_test_client.post(url_for('auth.signin'), data={'username': testuser1.username,
+                                                               'password': '123'})
+            response = app_test_client.get(url_for('main.home'))
+            self.assertTrue(response.is_streamed)
+            response_data = response.get_data(as_text=True)
+            self.assertTrue('testing-home-AMA' in response_data)
+            self.assertEqual(response_data.count('Q: '), 2)
+            #the flashed messages are shown once
+            self.assertTrue('you have logged in successfully' in response_data)
+            response = app_test_client.get(url_for('main.home'))
+            self.assertFalse('you have logged in successfully' in response.get_data(as_text=True))
+
+    def test_home_feed_new_questions(self):
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser1, testuser2 = User.query.get(1), User.query.get(2)
+        testuser1.password = '123'
+        testuser1.follow(testuser2)
+        app_database.session.commit()
+        User.generate_fake_questions(testuser2.username, count=2)
+        question1, question2 = testuser2.in_questions.all()
+        testuser2.answer_question(answer_content='answer1', question=question1)
+        app_database.session.commit()
+
+        with self.app.test_request_context():
+            with self.app.test_client() as app_test_client:
+                app_test_client.post(url_for('auth.signin'), data={'username': testuser1.username,
+                                                                   'password': '123'})
+                response = app_test_client.get(url_for('main.home'))
+                response_data = response.get_data(as_text=True)
+                self.assertTrue('answer1' in response_data)
+                #the home page never writes, the polls start from the newest question it shows
+                self.assertIsNone(testuser1.last_feed_seen_at)
+                new_questions_uri = html.unescape(re.search('data-new-questions-uri="([^"]*)"',
+                                                            response_data).group(1))
+
+                response_data = app_test_client.get(new_questions_uri).get_json()
+                self.assertEqual(response_data.get('count'), 0)
+                self.assertIsNone(testuser1.last_feed_seen_at)
+
+                testuser2.answer_question(answer_content='answer2', question=question2)
+                app_database.session.commit()
+
+                response_data = app_test_client.get(response_data.get('next')).get_json()
+                self.assertEqual(response_data.get('count'), 1)
+                self.assertTrue('answer2' in response_data.get('html'))
+                self.assertFalse('answer1' in response_data.get('html'))
+                self.assertIsNotNone(testuser1.last_feed_seen_at)
+
+                response_data = app_test_client.get(response_data.get('next')).get_json()
+                self.assertEqual(response_data.get('count'), 0)
+                #the seen marker is kept across pages
+                response_data = app_test_client.get(url_for('main.home_feed_new_questions')).get_json()
+                self.assertEqual(response_data.get('count'), 0)
+
+                response = app_test_client.get(url_for('main.home_feed_new_questions', since='foo'))
+                self.assertEqual(response.status_code, NotFound.code)
+
     def test_user_profile(self):
         '''
         test 3 cases:
@@ -73,6 +183,78 @@ class TestMainViews(unittest.TestCase):
                                                        username='foouser'))
                 self.assertTrue(response.status_code == 404)
 
+    def test_user_profile_tabs_pages(self):
+        Role.populate_table()
+        User.generate_fake_users(count=3)
+        testuser1, testuser2, testuser3 = User.query.get(1), User.query.get(2), User.query.get(3)
+        testuser1.password = '123'
+        testuser2.follow(testuser1)
+        testuser3.follow(testuser1)
+        app_database.session.commit()
+        User.generate_fake_questions(testuser1.username, count=5)
+        for question in testuser1.in_questions.limit(3).all():
+            testuser1.answer_question(answer_content='answer', question=question)
+        app_database.session.commit()
+        self.app.config['PROFILE_QUESTIONS_PER_PAGE'] = 2
+        self.app.config['PROFILE_USERS_PER_PAGE'] = 1
+
+        with self.app.test_request_context():
+            with self.app.test_client() as app_test_client:
+                app_test_client.post(url_for('auth.signin'), data={'username': testuser1.username,
+                                                                   'password': '123'})
+
+                for endpoint, pages_count in (('main.user_answered_questions_page', 2),
+                                              ('main.user_unanswered_questions_page', 1),
+                                              ('main.user_followers_page', 2)):
+                    pages = []
+                    next_page_uri = url_for(endpoint, username=testuser1.username)
+                    while next_page_uri:
+                        response_data = app_test_client.get(next_page_uri).get_json()
+                        pages.append(response_data.get('html'))
+                        next_page_uri = response_data.get('next')
+                    self.assertEqual(len(pages), pages_count)
+                self.assertTrue(testuser3.username in pages[0])
+                self.assertTrue(testuser2.username in pages[1])
+
+                response = app_test_client.get(url_for('main.user_followed_users_page',
+                                                       username=testuser1.username))
+                self.assertEqual(response.get_json(), {'html': '', 'next': None})
+
+                #unanswered questions are only listed to their replier
+                response = app_test_client.get(url_for('main.user_unanswered_questions_page',
+                                                       username=testuser2.username))
+                self.assertEqual(response.status_code, NotFound.code)
+
+    def test_user_profile_etag(self):
+        Role.populate_table()
+        User.generate_fake_users(count=2)
+        testuser1, testuser2 = User.query.get(1), User.query.get(2)
+        testuser1.password = '123'
+        app_database.session.commit()
+
+        with self.app.test_request_context():
+            with self.app.test_client() as app_test_client:
+                app_test_client.post(url_for('auth.signin'), data={'username': testuser1.username,
+                                                                   'password': '123'})
+
+                response = app_test_client.get(url_for('main.user_profile', username=testuser2.username))
+                etag, is_weak = response.get_etag()
+                self.assertIsNotNone(etag)
+                self.assertTrue('testing-user-profile-AMA' in response.get_data(as_text=True))
+
+                response = app_test_client.get(url_for('main.user_profile', username=testuser2.username),
+                                               headers={'If-None-Match': '"{}"'.format(etag)})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.get_data(as_text=True), '')
+
+                #following the user changes the page
+                app_test_client.get(url_for('main.follow_user', username=testuser2.username))
+                response = app_test_client.get(url_for('main.user_profile', username=testuser2.username),
+                                               headers={'If-None-Match': '"{}"'.format(etag)})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response.get_etag()[0], etag)
+                self.assertTrue('Unfollow' in response.get_data(as_text=True))
+
     def test_user_profile_edit(self):
         '''
         test 4 cases: